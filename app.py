@@ -36,8 +36,9 @@ statistics = st.Page("sections/statistics.py", title="📈 Statistics")
 analyze = st.Page("sections/analyze.py", title="🔍 Analyze")
 analytics = st.Page("sections/analytics.py", title="🤖 Analytics")
 alerts = st.Page("sections/alerts.py", title="🚨 Alerts")
+sql = st.Page("sections/sql.py", title="🧮 SQL")
 about = st.Page("sections/about.py", title="📄 About")
 
 
-pg = st.navigation([home, upload, statistics, analyze, analytics])
+pg = st.navigation([home, upload, statistics, analyze, analytics, alerts, sql])
 pg.run()
@@ -0,0 +1,54 @@
+alert_rules = {
+    # Each rule selects rows with "where" conditions (all must hold) and counts them per time
+    # "window" and per "group_by" key. It fires when the count exceeds "threshold", or, with
+    # "metric": "rate", when the share of matching rows among all rows of the window does.
+    # A rule is skipped when the dataset lacks one of the columns it uses.
+    #
+    # Conditions: {"column", "op", "value"} with op in ==, !=, <, <=, >, >=, in, not in,
+    # contains (case-insensitive regex), and internal / external (no value, uses the subnet
+    # definitions). Comparisons with numbers cast the column to a number first.
+    # "extract" adds columns captured by a regex (first group), usable in group_by.
+    "rules": [
+        {
+            "name": "External port scan on privileged ports",
+            "severity": "high",
+            "where": [
+                {"column": "action", "op": "==", "value": "DENY"},
+                {"column": "ipsrc", "op": "external"},
+                {"column": "portdst", "op": "<", "value": 1024},
+            ],
+            "group_by": ["ipsrc"],
+            "window": "5m",
+            "threshold": 100,
+        },
+        {
+            "name": "SSH brute force",
+            "severity": "high",
+            "extract": {
+                "ssh_source_ip": {
+                    "column": "Content",
+                    "pattern": r"from (\d{1,3}(?:\.\d{1,3}){3})",
+                }
+            },
+            "where": [
+                {"column": "Content", "op": "contains", "value": "Failed password"}
+            ],
+            "group_by": ["ssh_source_ip"],
+            "window": "1m",
+            "threshold": 20,
+        },
+        {
+            "name": "HTTP 5xx error rate",
+            "severity": "medium",
+            "where": [
+                {"column": "status", "op": ">=", "value": 500},
+                {"column": "status", "op": "<", "value": 600},
+            ],
+            "window": "5m",
+            "metric": "rate",
+            "threshold": 0.05,
+            # Windows with fewer requests are ignored
+            "min_rows": 20,
+        },
+    ],
+}
@@ -0,0 +1,15 @@
+subnet_definitions = {
+    # Labeled prefixes used to classify IP addresses. "internal" marks the university network:
+    # every address outside an internal prefix is considered external.
+    # The most specific prefix wins when several prefixes contain the same address.
+    "subnets": [
+        {"network": "192.168.0.0/16", "label": "University LAN", "internal": True},
+        {"network": "10.79.0.0/16", "label": "University VPN", "internal": True},
+        {"network": "159.84.0.0/16", "label": "University public", "internal": True},
+        {"network": "10.0.0.0/8", "label": "Private (RFC 1918)", "internal": False},
+        {"network": "172.16.0.0/12", "label": "Private (RFC 1918)", "internal": False},
+    ],
+    # Additional CSV files with "network,label,internal" columns (e.g. cloud provider ranges),
+    # to load thousands of prefixes without listing them here.
+    "files": [],
+}
@@ -1,7 +1,32 @@
+from datetime import timedelta
+
 import altair as alt
-import pandas as pd
+import polars as pl
+import plotly.express as px
 import streamlit as st
 
+from utils.alert_rules import get_alert_rule_engine
+from utils.alert_scheduler import get_alert_scheduler
+from utils.alerts import (
+    find_level_columns,
+    find_time_column,
+    run_alerts,
+)
+from utils.detectors import BRUTE_FORCE_WINDOW, SCAN_WINDOW
+from utils.error_detection import (
+    MIN_RUN_LENGTH,
+    label_error_runs,
+    summarize_runs,
+    text_columns,
+)
+from utils.grid import paginated_dataframe
+from utils.timeseries import build_time_pyramid
+
+# Error sequences whose entries are displayed
+RUNS_SHOWN = 5
+# Seconds between two checks of the background alert results by an open page
+ALERT_POLL_INTERVAL = 5
+
 st.title("📊 Alerts and Anomalies")
 
 if "parsed_df" not in st.session_state or st.session_state.parsed_df is None:
@@ -11,73 +36,45 @@ if "parsed_df" not in st.session_state or st.session_state.parsed_df is None:
 else:
     df = st.session_state.parsed_df
 
-    error_patterns = [
-        "error",
-        "critical",
-        "fatal",
-        "fail",
-        "exception",
-        "crash",
-        "timeout",
-    ]
-
-    possible_level_cols = [
-        "level",
-        "severity",
-        "log_level",
-        "type",
-        "status",
-        "content",
-        "message",
-    ]
-
-    # Function to identify errors by keywords
-    def detect_errors(dataframe, cols_to_search=None):
-        if cols_to_search is None:
-            # Search in all textual columns
-            cols_to_search = dataframe.select_dtypes(include=["object"]).columns
-
-        # Create a mask for rows containing errors
-        error_mask = pd.Series(False, index=dataframe.index)
-
-        for col in cols_to_search:
-            if col in dataframe.columns:  # Make sure the column exists
-                col_mask = (
-                    dataframe[col]
-                    .astype(str)
-                    .str.contains("|".join(error_patterns), case=False, na=False)
-                )
-                error_mask = error_mask | col_mask
+    level_cols = find_level_columns(df)
+    timestamp_col = find_time_column(df)
 
-        # Return only the rows with errors
-        return dataframe[error_mask].copy()
+    # Error masks, error types, hourly error counts and activity bands: one lazy plan on the shared frame
+    activity = None
+    if timestamp_col is not None and df.schema[timestamp_col] == pl.Datetime:
+        pyramid = st.session_state.dataset_handle.derived(
+            f"time_pyramid:{timestamp_col}",
+            lambda frame: build_time_pyramid(frame, time_col=timestamp_col),
+        )
+        activity = pyramid["levels"]["minute"].lazy().rename({"bucket": timestamp_col})
+    with st.spinner("Analyzing the logs..."):
+        # The columns are found from the schema, so the result is computed once per dataset and shared
+        results = st.session_state.dataset_handle.derived(
+            "alerts",
+            lambda frame: run_alerts(frame, level_cols, timestamp_col, activity),
+        )
+    error_df = results.get("errors", pl.DataFrame())
+
+    # Rule alerts and detections are evaluated in the background on the new rows of the stream
+    scheduler = get_alert_scheduler()
+    stream = scheduler.track(st.session_state.dataset_handle)
+    background = scheduler.snapshot(stream) if stream is not None else None
+    # Results of a dataset appended to this one (another session) cover this dataset too
+    background_ready = (
+        background is not None
+        and st.session_state.dataset_handle.key in background["datasets"]
+    )
 
     # Display overall statistics
     st.subheader("Overview of logs")
     col1, col2, col3 = st.columns(3)
 
-    # Initialize error_df as an empty DataFrame
-    error_df = pd.DataFrame()
-
     with col1:
         total_entries = len(df)
         st.metric("Total number of entries", total_entries)
 
     with col2:
-        # Check if the 'level' column exists, otherwise look for a similar column
-        level_cols = None
-        level_cols = [
-            col
-            for col in df.columns
-            if any(
-                possible_col.lower() == col.lower()
-                for possible_col in possible_level_cols
-            )
-        ]
-
         if level_cols:
-            # Create a boolean mask for rows containing errors in any relevant column
-            error_df = detect_errors(df, level_cols)
             error_count = len(error_df)
 
             error_percent = (
@@ -88,23 +85,6 @@ else:
             st.metric("Error entries", "Not detectable")
 
     with col3:
-        # Search for a datetime type column
-        timestamp_col = None
-
-        # First, look for columns that are already of datetime type
-        datetime_cols = [
-            col for col in df.columns if pd.api.types.is_datetime64_any_dtype(df[col])
-        ]
-        if datetime_cols:
-            timestamp_col = datetime_cols[0]
-        else:
-            # If no datetime column is found, try to find by name
-            possible_ts_cols = ["timestamp", "date", "time", "datetime"]
-            for col in possible_ts_cols:
-                if col in df.columns:
-                    timestamp_col = col
-                    break
-
         if timestamp_col:
             time_range = f"{df[timestamp_col].min()} to {df[timestamp_col].max()}"
             st.markdown(
@@ -114,80 +94,69 @@ else:
         else:
             st.metric("Time range", "Not detectable")
 
+    if stream is not None:
+
+        @st.fragment(run_every=ALERT_POLL_INTERVAL)
+        def live_alerts():
+            """Show the latest background alerts and rerun the page when new results arrive."""
+            snapshot = scheduler.snapshot(stream)
+            if snapshot is None:
+                return
+            seen = st.session_state.get("alerts_seen_version")
+            current = (stream, snapshot["version"])
+            if seen != current:
+                st.session_state.alerts_seen_version = current
+                if seen is not None and seen[0] == stream:
+                    if snapshot["new_alerts"]:
+                        st.toast(f"🚨 {snapshot['new_alerts']} new alerts")
+                    st.rerun()
+
+            st.subheader("Live alerts")
+            if snapshot["error"]:
+                st.error(f"Background alert evaluation failed: {snapshot['error']}")
+            if snapshot["evaluated_at"] is None:
+                if not snapshot["error"]:
+                    st.info("Alerts are being evaluated in the background...")
+                return
+            st.caption(
+                f"Evaluated at {snapshot['evaluated_at']:%H:%M:%S} on the data up to "
+                f"{snapshot['evaluated_until']}, checked every {scheduler.interval:g} s."
+            )
+            if snapshot["table"].is_empty():
+                st.success("No alert raised so far.")
+            else:
+                st.dataframe(snapshot["table"], height=250)
+
+        live_alerts()
+
     # Detection of critical errors
     st.subheader("Detected critical errors")
 
-    if not error_df.empty:
+    if not error_df.is_empty():
         st.write(f"**{len(error_df)} critical errors detected**")
-        st.dataframe(error_df)
+        paginated_dataframe(error_df, key="error_grid")
 
         # Extraction of the most common error types
         if len(error_df) > 5:
             st.subheader("Frequent error types")
-            error_types = {}
-
-            # Browse textual columns to extract error patterns
-            for col in error_df.select_dtypes(include=["object"]).columns:
-                for pattern in ["error", "exception", "fail"]:
-                    pattern_errors = error_df[
-                        error_df[col].str.contains(pattern, case=False, na=False)
-                    ]
-                    if not pattern_errors.empty:
-                        # Extract error context (words after the pattern)
-                        for _, row in pattern_errors.iterrows():
-                            text = str(row[col])
-                            if pattern.lower() in text.lower():
-                                idx = text.lower().find(pattern.lower())
-                                context = (
-                                    text[idx : idx + 50].strip()
-                                    if idx + 50 < len(text)
-                                    else text[idx:].strip()
-                                )
-                                if context not in error_types:
-                                    error_types[context] = 0
-                                error_types[context] += 1
-
-            # Display the most frequent error types
-            sorted_errors = sorted(
-                error_types.items(), key=lambda x: x[1], reverse=True
-            )[:10]
-            error_types_df = pd.DataFrame(
-                sorted_errors, columns=["Error type", "Occurrences"]
-            )
+            error_types_df = results["error_types"]
             st.dataframe(error_types_df)
 
             # Visualization of errors
-            if timestamp_col:
+            if "error_counts" in results:
                 st.subheader("Temporal distribution of errors")
+                error_count = results["error_counts"]
 
-                # Convert to datetime if necessary
-                if not pd.api.types.is_datetime64_any_dtype(error_df[timestamp_col]):
-                    try:
-                        error_df[timestamp_col] = pd.to_datetime(
-                            error_df[timestamp_col]
-                        )
-                    except:
-                        pass
-
-                if pd.api.types.is_datetime64_any_dtype(error_df[timestamp_col]):
-                    # Group by time period
-                    error_count = (
-                        error_df.groupby(pd.Grouper(key=timestamp_col, freq="1h"))
-                        .size()
-                        .reset_index()
-                    )
-                    error_count.columns = [timestamp_col, "count"]
-
-                    # Create the chart with plotly
-                    import plotly.express as px
-
-                    fig = px.line(
-                        error_count, x=timestamp_col, y="count", title="Errors per hour"
-                    )
-                    fig.update_layout(
-                        xaxis_title="Time", yaxis_title="Number of errors", height=300
-                    )
-                    st.plotly_chart(fig, use_container_width=True)
+                fig = px.line(
+                    error_count,
+                    x=timestamp_col,
+                    y="count",
+                    title="Errors per hour",
+                )
+                fig.update_layout(
+                    xaxis_title="Time", yaxis_title="Number of errors", height=300
+                )
+                st.plotly_chart(fig, use_container_width=True)
     else:
         st.success("No critical errors detected in the logs.")
 
@@ -195,46 +164,15 @@ else:
     st.subheader("Anomaly detection")
 
     # Temporal analysis if possible
-    if timestamp_col is not None and (
-        pd.api.types.is_datetime64_any_dtype(df[timestamp_col])
-        or pd.api.types.is_datetime64_any_dtype(
-            pd.to_datetime(df[timestamp_col], errors="coerce")
-        )
-    ):
+    if "activity" in results:
         try:
-            # Convert to datetime if necessary
-            if not pd.api.types.is_datetime64_any_dtype(df[timestamp_col]):
-                df[timestamp_col] = pd.to_datetime(df[timestamp_col], errors="coerce")
-
-            # Group by time period
-            time_df = (
-                df.groupby(pd.Grouper(key=timestamp_col, freq="5Min"))
-                .size()
-                .reset_index()
-            )
-            time_df.columns = [timestamp_col, "count"]
-
-            # Calculate moving average and limits
-            time_df["moving_avg"] = (
-                time_df["count"].rolling(window=5, min_periods=1).mean()
-            )
-            time_df["std"] = (
-                time_df["count"].rolling(window=5, min_periods=1).std().fillna(0)
-            )
-            time_df["upper_bound"] = time_df["moving_avg"] + 2 * time_df["std"]
-            time_df["lower_bound"] = (time_df["moving_avg"] - 2 * time_df["std"]).clip(
-                lower=0
-            )
-
-            # Detection of peaks
-            time_df["is_anomaly"] = (time_df["count"] > time_df["upper_bound"]) | (
-                time_df["count"] < time_df["lower_bound"]
-            )
+            # Entries per 5 minutes, moving average and limits (mean +/- 2 std over 5 periods)
+            time_df = results["activity"]
 
             # Visualization
-            anomaly_points = time_df[time_df["is_anomaly"]]
+            anomaly_points = time_df.filter("is_anomaly")
 
-            if not anomaly_points.empty:
+            if not anomaly_points.is_empty():
                 st.write(
                     f"**{len(anomaly_points)} periods with abnormal activity detected**"
                 )
@@ -275,16 +213,13 @@ else:
 
                 # Table of anomalies
                 st.write("Periods with abnormal activity:")
-                anomaly_df = anomaly_points[
-                    [timestamp_col, "count", "moving_avg", "upper_bound", "lower_bound"]
-                ]
-                anomaly_df.columns = [
-                    "Period",
-                    "Number of entries",
-                    "Moving average",
-                    "Upper limit",
-                    "Lower limit",
-                ]
+                anomaly_df = anomaly_points.select(
+                    pl.col(timestamp_col).alias("Period"),
+                    pl.col("count").alias("Number of entries"),
+                    pl.col("moving_avg").alias("Moving average"),
+                    pl.col("upper_bound").alias("Upper limit"),
+                    pl.col("lower_bound").alias("Lower limit"),
+                )
                 st.dataframe(anomaly_df)
             else:
                 st.success("No temporal anomalies detected.")
@@ -292,45 +227,134 @@ else:
         except Exception as e:
             st.error(f"Unable to analyze the temporal distribution of logs: {e}")
 
+    # Online detector: updated by the background scheduler on the new buckets of the stream
+    if stream is not None:
+        st.subheader("Online detector")
+        if not background_ready:
+            if background is not None and background["error"]:
+                st.error(f"Unable to run the online detector: {background['error']}")
+            else:
+                st.info("The online detector is being updated in the background...")
+        else:
+            state = background["detector"]
+            st.caption(
+                f"EWMA baseline per {state['every']} (alpha {state['alpha']}, "
+                f"{state['sigmas']} std); {state['buckets_scored']} periods scored up to "
+                f"{state['scored_until']}."
+            )
+            with st.expander("Detector state"):
+                st.json(state)
+                if st.button("Reset detector state", key="reset_online_detector"):
+                    scheduler.reset_detector(stream)
+                    st.rerun()
+
+            online_anomalies = background["anomalies"]
+            if not online_anomalies.is_empty():
+                st.write(
+                    f"**{len(online_anomalies)} periods flagged by the online detector**"
+                )
+                st.dataframe(
+                    online_anomalies.select(
+                        pl.col("bucket").alias("Period"),
+                        pl.col("count").alias("Number of entries"),
+                        pl.col("expected").alias("Expected"),
+                        pl.col("upper_bound").alias("Upper limit"),
+                        pl.col("lower_bound").alias("Lower limit"),
+                    )
+                )
+            else:
+                st.success("No anomalies flagged by the online detector.")
+
+    # Alerts from the rules of config/alert_rules.py, evaluated together in one query
+    rule_engine = get_alert_rule_engine()
+    active_rules = rule_engine.applicable(df.columns)
+    if active_rules and timestamp_col and df.schema[timestamp_col] == pl.Datetime:
+        st.subheader("Rule-based alerts")
+        st.caption(
+            "Rules evaluated: " + ", ".join(rule["name"] for rule in active_rules)
+        )
+        if not background_ready:
+            if background is not None and background["error"]:
+                st.error(f"Unable to evaluate the alert rules: {background['error']}")
+            else:
+                st.info("The rules are being evaluated in the background...")
+        else:
+            rule_alerts = background["rules"]
+            if not rule_alerts.is_empty():
+                st.write(f"**{len(rule_alerts)} alerts raised**")
+                st.dataframe(
+                    rule_alerts.group_by("rule", "severity")
+                    .agg(
+                        pl.len().alias("Alerts"),
+                        pl.col("window_start").min().alias("First"),
+                        pl.col("window_start").max().alias("Last"),
+                    )
+                    .sort("Alerts", descending=True)
+                )
+                paginated_dataframe(rule_alerts, key="rule_alerts_grid")
+            else:
+                st.success("No alert rule was triggered.")
+
+    # Port scans (firewall logs) and SSH brute force (auth/ssh logs) over sliding windows
+    if background_ready:
+        detections = background["detections"]
+        if not detections.is_empty():
+            st.subheader("Port scans and brute force")
+            st.write(
+                f"**{len(detections)} suspicious sources detected** "
+                f"(sliding windows of {SCAN_WINDOW} for scans, {BRUTE_FORCE_WINDOW} for brute force)"
+            )
+            paginated_dataframe(detections, key="detections_grid")
+
     # Detection of suspicious event sequences
     if timestamp_col and level_cols:
         st.subheader("Unusual event sequences")
+        setting1, setting2, setting3 = st.columns(3)
+        with setting1:
+            min_run_length = st.number_input(
+                "Minimum consecutive errors", min_value=2, value=MIN_RUN_LENGTH
+            )
+        with setting2:
+            max_gap_seconds = st.number_input(
+                "Maximum gap between errors (seconds, 0 = no limit)",
+                min_value=0,
+                value=0,
+            )
+        with setting3:
+            run_group_cols = st.multiselect(
+                "Separate sequences by",
+                [col for col in text_columns(df) if col not in level_cols],
+                help="For example the host or the component that emitted the entries.",
+            )
         try:
-            # Search for consecutive error sequences
-            df_sorted = df.sort_values(by=timestamp_col)
-            consecutive_errors = []
-
-            current_sequence = []
-            for i, row in df_sorted.iterrows():
-                # Check if any of the columns contain error levels
-                is_error = False
-                for col in level_cols:
-                    if str(row[col]).upper() in ["ERROR", "CRITICAL", "FATAL"]:
-                        is_error = True
-                        break
-                if is_error:
-                    current_sequence.append(i)
-                else:
-                    if len(current_sequence) >= 3:  # At least 3 consecutive errors
-                        consecutive_errors.append(current_sequence)
-                    current_sequence = []
-
-            if len(current_sequence) >= 3:  # Don't forget the last sequence
-                consecutive_errors.append(current_sequence)
-
-            if consecutive_errors:
+            # Runs of consecutive errors: flag, cumulative sum over run starts, length by group_by
+            run_rows = label_error_runs(
+                df,
+                level_cols,
+                timestamp_col,
+                run_group_cols,
+                timedelta(seconds=max_gap_seconds) if max_gap_seconds else None,
+            ).collect()
+            consecutive_errors = summarize_runs(
+                run_rows, timestamp_col, run_group_cols, min_run_length
+            ).collect()
+
+            if not consecutive_errors.is_empty():
                 st.write(
-                    f"**{len(consecutive_errors)} sequences of 3+ consecutive errors detected**"
+                    f"**{len(consecutive_errors)} sequences of {min_run_length}+ consecutive errors detected**"
                 )
-
-                # For each sequence, display the relevant entries
-                for i, sequence in enumerate(
-                    consecutive_errors[:5]
-                ):  # Limit to 5 sequences for clarity
+                paginated_dataframe(consecutive_errors, key="error_runs_grid")
+
+                # Only the entries of the sequences displayed are gathered
+                shown = consecutive_errors.head(RUNS_SHOWN)
+                sequences = run_rows.filter(
+                    pl.col("run_id").is_in(shown["run_id"].to_list())
+                ).partition_by("run_id", as_dict=True, include_key=False)
+                for i, run in enumerate(shown.iter_rows(named=True)):
                     with st.expander(
-                        f"Sequence {i + 1}: {len(sequence)} consecutive errors"
+                        f"Sequence {i + 1}: {run['length']} consecutive errors"
                     ):
-                        st.dataframe(df.loc[sequence])
+                        st.dataframe(df[sequences[(run["run_id"],)]["row"]])
             else:
                 st.success("No sequences of consecutive errors detected.")
 
@@ -340,27 +364,41 @@ else:
     # Recommendations
     st.subheader("Recommendations")
 
-    if not error_df.empty:
+    if not error_df.is_empty():
         st.warning(
             "⚠️ Critical errors have been detected. Review the entries in red for more details."
         )
 
-        if "error_types" in locals() and error_types:
-            top_error = sorted_errors[0][0]
+        if "error_types_df" in locals() and not error_types_df.is_empty():
+            top_error = error_types_df["Error type"][0]
             st.info(
                 f"💡 The most frequent error is '{top_error}'. Focus your analysis on this type of error."
             )
 
-    if "anomaly_points" in locals() and not anomaly_points.empty:
-        peak_time = anomaly_points.iloc[anomaly_points["count"].idxmax()][timestamp_col]
+    if "anomaly_points" in locals() and not anomaly_points.is_empty():
+        peak_time = anomaly_points.sort("count")[timestamp_col][-1]
         st.warning(
             f"⚠️ A significant activity peak was detected around {peak_time}. Review this period."
         )
 
-    if "consecutive_errors" in locals() and consecutive_errors:
+    if "rule_alerts" in locals() and not rule_alerts.is_empty():
+        top_rule = rule_alerts["rule"].mode().sort()[0]
+        st.warning(
+            f"⚠️ {len(rule_alerts)} rule-based alerts were raised, mostly '{top_rule}'. Review the sources involved."
+        )
+
+    if "detections" in locals() and not detections.is_empty():
+        top_source = detections.row(0, named=True)
+        st.warning(
+            f"⚠️ {top_source['detector']} from {top_source['source']} ({top_source['target']}). Consider blocking this source."
+        )
+
+    if "consecutive_errors" in locals() and not consecutive_errors.is_empty():
         st.warning(
             "⚠️ Sequences of consecutive errors have been detected, which may indicate systemic issues."
         )
 
-    if error_df.empty and ("anomaly_points" not in locals() or anomaly_points.empty):
+    if error_df.is_empty() and (
+        "anomaly_points" not in locals() or anomaly_points.is_empty()
+    ):
         st.success("✅ No major issues detected in the analyzed logs.")
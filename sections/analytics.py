@@ -1,14 +1,22 @@
-import pandas as pd
 import plotly.express as px
 from plotly.subplots import make_subplots
 import plotly.graph_objs as go
 import streamlit as st
 import polars as pl
 
-from sklearn.preprocessing import StandardScaler
-from sklearn.preprocessing import OneHotEncoder
-from sklearn.cluster import KMeans
-from sklearn.decomposition import PCA
+from utils.clustering import (
+    FEATURE_COLUMNS,
+    K_CANDIDATES,
+    PROFILE_TOP_VALUES,
+    SAMPLE_SIZE,
+    SparseFeatureEncoder,
+    cluster_profiles,
+    fit_clusters,
+    load_clustering,
+    save_clustering,
+    select_n_clusters,
+)
+from utils.plotting import SCATTER_POINT_BUDGET, density_tiles
 
 if "parsed_df" not in st.session_state:
     st.session_state.parsed_df = None
@@ -22,120 +30,197 @@ if st.session_state.parsed_df is None:
     st.stop()
 
 data = st.session_state.parsed_df
-data = data.select(["portdst","protocole","rule","action"])
-
-##############################################
-####            Preprocessing             ####
-##############################################
-
-# Encodage one-hot
-
-encoder = OneHotEncoder(sparse_output=False)
-data_encoded = encoder.fit_transform(data.to_pandas())
-
-col_names = [
-    f"{feature}_{category}" 
-    for feature, categories in zip(data.columns, encoder.categories_)
-    for category in categories
-]
-
-# Convertir de nouveau en DataFrame Polars
-data_encoded = pl.from_pandas(pd.DataFrame(data_encoded, columns=col_names))
+data = data.select(FEATURE_COLUMNS)
 
 ###############################################
 ####              Clustering               ####
 ###############################################
 
-if st.button("Start clustering"):
-    if st.session_state.parsed_df is not None:
-        with st.spinner("Searching the clusters..."):
-            try:
-
-                ncp = 2
-                pca = PCA(n_components=ncp)
-                df_pca = pca.fit_transform(data_encoded.to_pandas())                
-
-                cp1_var = round(pca.explained_variance_ratio_[0],3)
-                cp2_var = round(pca.explained_variance_ratio_[1],3)
-
-                # Appliquer K-Means avec k optimal choisi
-                k_optimal = 2  # Par exemple, supposons que k = 3
-                kmeans = KMeans(n_clusters=k_optimal, random_state=42)
-                preds = kmeans.fit_predict(df_pca)
-                df_pca = pl.from_pandas(pd.DataFrame(df_pca, columns=[f"Component {i+1}" for i in range(ncp)]))
-                df_clust = df_pca.with_columns(pl.Series(values=preds, name='cluster_kmeans'))
-
-                if df_clust.shape[0] > 200000: # 200k
-                    perc = 200000/df_clust.shape[0]
-                else:
-                    perc = 1
-                df_ech = pl.from_pandas(df_clust.to_pandas()
-                                    .groupby("cluster_kmeans", group_keys=False)
-                                    .apply(lambda x: x.sample(frac=perc, random_state=42))
-                                    )
-
-                ###############################################################
-                ####              Visualisation des clusters               ####
-                ###############################################################
-
-
-                # Visualisation des clusters (en 2D avec PCA)
-                fig = px.scatter(
-                    x=df_ech.select("Component 1").to_numpy().flatten(),
-                    y=df_ech.select("Component 2").to_numpy().flatten(),
-                    color=df_ech.select('cluster_kmeans').to_numpy().flatten().astype(str),
-                    color_discrete_map={"0": "rebeccapurple", "1": "gold"},
-                    title=f'Clustering coupled with PCA ({pca.explained_variance_ratio_.sum():.3f})',
-                    labels={'x': 'Component 1', 'y': 'Component 2', 'color': 'Cluster'},
-                    hover_data={
-                        "ip": st.session_state.parsed_df.select("ipsrc").to_numpy().flatten()
-                    }
-                )
-
-                fig.update_layout(
-                    xaxis_title=f'Component 1 ({cp1_var})',
-                    yaxis_title=f'Component 2 ({cp2_var})'
-                )
-                # fig.show()
-                st.plotly_chart(fig, use_container_width=True)
-                
-            except Exception as e:
-                st.error(f"An error occured while doing the clustering : {e}")
-
-        with st.spinner("Performing some more data analysis..."):
-            try:
-                data_clust = data.with_columns(pl.Series(name="cluster_kmeans", values=df_clust.select("cluster_kmeans")))
-                # Analyse des variables qualitatives par cluster
-                for col in data.columns : # portdst, protocole, rule, action
-                    fig = make_subplots(rows=1, cols=2)
-
-                    data_filtered = data_clust.filter(pl.col("cluster_kmeans") == 0)
-                    freq_df = data_filtered.group_by(col).agg(pl.count(col).alias("frequency"))
-
-                    fig.add_trace(
-                        go.Bar(x=freq_df[col], y=freq_df['frequency'], name='Cluster 0',
-                               marker=dict(color='rebeccapurple')),
-                        row=1, col=1
+# Mode de clustering : complet (KMeans sur toutes les lignes) ou sur échantillon (MiniBatchKMeans)
+scalable_mode = st.radio(
+    "Clustering mode",
+    ["Full (KMeans on every row)", "Scalable (MiniBatchKMeans fitted on a sample)"],
+    index=0 if data.height <= SAMPLE_SIZE else 1,
+    horizontal=True,
+).startswith("Scalable")
+
+sample_size = SAMPLE_SIZE
+if scalable_mode:
+    sample_size = st.number_input(
+        "Sample size used to fit the model (stratified by action)",
+        min_value=1000,
+        max_value=max(data.height, 1000),
+        value=min(SAMPLE_SIZE, max(data.height, 1000)),
+        step=10000,
+    )
+
+# Nombre de clusters : choisi automatiquement (silhouette sur un échantillon) ou imposé
+n_clusters = st.selectbox(
+    "Number of clusters",
+    ["auto"] + list(K_CANDIDATES),
+    help="'auto' evaluates every candidate k on a sample and keeps the best silhouette score.",
+)
+
+clustering_params = {
+    "n_clusters": n_clusters,
+    "mode": "scalable" if scalable_mode else "full",
+    "sample_size": sample_size,
+}
+start_clustering = st.button("Start clustering")
+
+# Un clustering déjà calculé pour ce jeu de données (ou celui auquel il a été ajouté) est réutilisé
+with st.spinner("Loading the saved clustering..."):
+    clustering = load_clustering(st.session_state.dataset_handle, clustering_params)
+
+if clustering is None and start_clustering:
+    with st.spinner("Searching the clusters..."):
+        try:
+            ##############################################
+            ####            Preprocessing             ####
+            ##############################################
+
+            # Encodage one-hot creux (CSR), hachage des colonnes à forte cardinalité
+            encoder = SparseFeatureEncoder()
+            data_encoded = encoder.fit_transform(data)
+
+            # Choix de k : les candidats sont évalués en parallèle sur un échantillon borné
+            selection = None
+            k_optimal = n_clusters
+            if n_clusters == "auto":
+                with st.spinner("Choosing the number of clusters..."):
+                    k_optimal, selection = select_n_clusters(
+                        data_encoded, strata=data["action"]
                     )
 
-                    data_filtered = data_clust.filter(pl.col("cluster_kmeans") == 1)
-                    freq_df = data_filtered.group_by(col).agg(pl.count(col).alias("frequency"))
-
+            # TruncatedSVD travaille directement sur la matrice creuse (pas de PCA dense),
+            # puis K-Means avec k optimal choisi. En mode "Scalable", les lignes sont
+            # projetées et affectées aux clusters par lots.
+            progress_bar = st.progress(0.0, text="Assigning rows to clusters...")
+            reducer, model, coordinates, labels = fit_clusters(
+                data_encoded,
+                k_optimal,
+                mode=clustering_params["mode"],
+                sample_size=sample_size,
+                strata=data["action"],
+                progress=lambda done: progress_bar.progress(
+                    done, text=f"Assigning rows to clusters... {done:.0%}"
+                ),
+            )
+            progress_bar.empty()
+
+            clustering = {
+                "encoder": encoder,
+                "reducer": reducer,
+                "model": model,
+                "coordinates": coordinates,
+                "labels": labels,
+                "n_clusters": k_optimal,
+                "selection": selection,
+            }
+            save_clustering(st.session_state.dataset_handle.key, clustering_params, clustering)
+        except Exception as e:
+            st.error(f"An error occured while doing the clustering : {e}")
+
+if clustering is not None and clustering.get("selection") is not None:
+    selection = clustering["selection"]
+    st.write(
+        f"**{clustering['n_clusters']} clusters** selected among k = "
+        f"{selection['k'].min()}..{selection['k'].max()} (best silhouette score)."
+    )
+    fig = make_subplots(rows=1, cols=3, subplot_titles=["Silhouette (higher is better)", "Davies-Bouldin (lower is better)", "Inertia (elbow)"])
+    for i, score in enumerate(["silhouette", "davies_bouldin", "inertia"]):
+        fig.add_trace(
+            go.Scatter(x=selection["k"], y=selection[score], mode="lines+markers", name=score, marker=dict(color='rebeccapurple')),
+            row=1, col=i + 1
+        )
+        fig.add_vline(x=clustering["n_clusters"], line_dash="dash", line_color="gold", row=1, col=i + 1)
+    fig.update_layout(title="Choice of the number of clusters", showlegend=False)
+    fig.update_xaxes(title_text="k")
+    st.plotly_chart(fig, use_container_width=True)
+
+if clustering is not None:
+    try:
+        ncp = 2
+        pca = clustering["reducer"]
+        cp1_var = round(pca.explained_variance_ratio_[0],3)
+        cp2_var = round(pca.explained_variance_ratio_[1],3)
+        df_pca = pl.DataFrame(clustering["coordinates"], schema=[f"Component {i+1}" for i in range(ncp)])
+        df_clust = df_pca.with_columns(pl.Series(values=clustering["labels"], name='cluster_kmeans'))
+        # Une couleur par cluster, quel que soit k
+        palette = ["rebeccapurple", "gold"] + px.colors.qualitative.Plotly
+        cluster_colors = {str(i): palette[i % len(palette)] for i in range(int(clustering["labels"].max()) + 1)}
+
+        ###############################################################
+        ####              Visualisation des clusters               ####
+        ###############################################################
+
+
+        # Visualisation des clusters (en 2D avec SVD)
+        if df_clust.shape[0] <= SCATTER_POINT_BUDGET:
+            fig = px.scatter(
+                x=df_clust["Component 1"].to_numpy(),
+                y=df_clust["Component 2"].to_numpy(),
+                color=df_clust["cluster_kmeans"].to_numpy().astype(str),
+                color_discrete_map=cluster_colors,
+                title=f'Clustering coupled with SVD ({pca.explained_variance_ratio_.sum():.3f})',
+                labels={'x': 'Component 1', 'y': 'Component 2', 'color': 'Cluster'},
+                hover_data={
+                    "ip": st.session_state.parsed_df["ipsrc"].to_numpy()
+                },
+                render_mode="webgl",
+            )
+        else:
+            # Trop de points : densité par tuiles 2D calculée côté serveur, une couleur par cluster
+            tiles = density_tiles(
+                df_clust["Component 1"].to_numpy(),
+                df_clust["Component 2"].to_numpy(),
+                df_clust["cluster_kmeans"].to_numpy(),
+            )
+            fig = px.scatter(
+                x=tiles["x"].to_numpy(),
+                y=tiles["y"].to_numpy(),
+                color=tiles["group"].to_numpy().astype(str),
+                size=tiles["count"].to_numpy(),
+                color_discrete_map=cluster_colors,
+                title=f'Clustering coupled with SVD ({pca.explained_variance_ratio_.sum():.3f})',
+                labels={'x': 'Component 1', 'y': 'Component 2', 'color': 'Cluster', 'size': 'Points'},
+                render_mode="webgl",
+            )
+
+        fig.update_layout(
+            xaxis_title=f'Component 1 ({cp1_var})',
+            yaxis_title=f'Component 2 ({cp2_var})'
+        )
+        # fig.show()
+        st.plotly_chart(fig, use_container_width=True)
+
+    except Exception as e:
+        st.error(f"An error occured while doing the clustering : {e}")
+
+    with st.spinner("Performing some more data analysis..."):
+        try:
+            # Fréquences de toutes les variables qualitatives pour tous les clusters, en une seule passe
+            profiles = cluster_profiles(data, clustering["labels"])
+            clusters = sorted(profiles["cluster"].unique().to_list())
+            for col in data.columns : # portdst, protocole, rule, action
+                fig = make_subplots(rows=1, cols=len(clusters), subplot_titles=[f"Cluster {c}" for c in clusters])
+                feature_profile = profiles.filter(pl.col("feature") == col)
+
+                for i, cluster in enumerate(clusters):
+                    freq_df = feature_profile.filter(pl.col("cluster") == cluster)
                     fig.add_trace(
-                        go.Bar(x=freq_df[col], y=freq_df['frequency'], name='Cluster 1',
-                               marker=dict(color='gold')),
-                        row=1, col=2
+                        go.Bar(x=freq_df['value'], y=freq_df['frequency'], name=f'Cluster {cluster}',
+                               marker=dict(color=cluster_colors[str(cluster)])),
+                        row=1, col=i + 1
                     )
 
-                    fig.update_layout(
-                        title=f'{col} frequencies by cluster',
-                        xaxis_title='Category',
-                        yaxis_title='Frequency',
-                        showlegend=True
-                    )
-                    st.plotly_chart(fig, use_container_width=True)
+                fig.update_layout(
+                    title=f'{col} frequencies by cluster (top {PROFILE_TOP_VALUES} values)',
+                    xaxis_title='Category',
+                    yaxis_title='Frequency',
+                    showlegend=True
+                )
+                st.plotly_chart(fig, use_container_width=True)
 
-            except Exception as e:
-                st.error(f"An error occured while doing the data analysis : {e}")
-    else:
-        st.warning("Please parse the log file first.")
\ No newline at end of file
+        except Exception as e:
+            st.error(f"An error occured while doing the data analysis : {e}")
@@ -1,12 +1,30 @@
 import datetime
-import ipaddress
 
-import pandas as pd
 import plotly.express as px
 import plotly.graph_objs as go
 import polars as pl
 import streamlit as st
 
+from utils.aggregates import (
+    activity_series,
+    flow_counts,
+    source_ip_activity,
+    top_permitted_ports,
+    top_sources,
+)
+from utils.cube import build_traffic_cube
+from utils.grid import paginated_dataframe
+from utils.plotting import (
+    LINE_POINT_BUDGET,
+    SCATTER_POINT_BUDGET,
+    downsample_line,
+    top_categories,
+)
+from utils.sankey import SANKEY_TOP_K, prune_flows, sankey_links
+from utils.subnets import get_subnet_registry
+from utils.time_index import time_slice
+from utils.timeseries import build_time_pyramid, select_level, time_extent
+
 if "parsed_df" not in st.session_state:
     st.session_state.parsed_df = None
 
@@ -19,21 +37,19 @@ if st.session_state.parsed_df is None:
     st.stop()
 
 data = st.session_state.parsed_df
+fingerprint = st.session_state.dataset_handle.key
+# Cube d'agrégats construit une seule fois par jeu de données (à l'upload) et partagé par les onglets
+cube = st.session_state.dataset_handle.derived("traffic_cube", build_traffic_cube)
 
-university_subnets = [
-    ipaddress.ip_network("192.168.0.0/16"),
-    ipaddress.ip_network("10.79.0.0/16"),
-    ipaddress.ip_network("159.84.0.0/16"),
-]
+# Sous-réseaux universitaires définis dans config/subnet_definitions.py
+subnet_registry = get_subnet_registry()
 
 
-# Fonction pour vérifier si une IP appartient aux sous-réseaux universitaires
-def is_university_ip(ip):
-    try:
-        ip_obj = ipaddress.ip_address(ip)
-        return any(ip_obj in subnet for subnet in university_subnets)
-    except ValueError:
-        return False
+@st.cache_data(max_entries=8, show_spinner=False)
+def university_source_ips(fingerprint, _cube):
+    """Distinct source IPs belonging to the university subnets (each IP is classified once)."""
+    ips = _cube["ipsrc"].unique()
+    return ips.filter(subnet_registry.is_internal(ips)).cast(pl.Utf8).to_list()
 
 
 # Créer les onglets principaux
@@ -151,18 +167,15 @@ with tab1:
             st.error("The start date cannot be later than the end date.")
         else:
             # Conversion des dates en datetime
-            start_datetime = pl.datetime(
-                start_date.year, start_date.month, start_date.day
-            )
-            end_datetime = pl.datetime(
-                end_date.year, end_date.month, end_date.day, 23, 59, 59
+            start_datetime = datetime.datetime.combine(start_date, datetime.time(0, 0))
+            end_datetime = datetime.datetime.combine(
+                end_date, datetime.time(23, 59, 59)
             )
 
             # ---- APPLICATION DES FILTRES ----
-            filtered_data = data.filter(
-                (pl.col("timestamp") >= start_datetime)
-                & (pl.col("timestamp") <= end_datetime)
-            )
+            # Recherche dichotomique sur la colonne triée : la tranche ne copie pas les données,
+            # les autres filtres ne parcourent ensuite que cette tranche
+            filtered_data = time_slice(data, start_datetime, end_datetime)
 
             # Correction du filtrage par action(forcer conversion Utf8)
             if "action" in data.columns and selected_action != "All":
@@ -179,7 +192,7 @@ with tab1:
 
             # Affichage des données filtrées
             st.write(f"### 🔍 Data filtered : {filtered_data.shape[0]} entries")
-            st.dataframe(filtered_data, use_container_width=True)
+            paginated_dataframe(filtered_data, key="explore_grid")
 
     else:
         st.warning(
@@ -193,47 +206,23 @@ with tab2:
     # Créer ici un scatter plot permettant une Visualisation interactive des données (IP source avec le nombre
     # d’occurrences de destination contactées, incluant le nombre de flux rejetés et autorisés).
 
-    # Agréger les données par IP source
-    df_agg = data.group_by("ipsrc").agg(
-        [
-            pl.col("ipdst").n_unique().alias("distinct_destinations"),
-            ((pl.col("action") == "PERMIT").cast(pl.Int64)).sum().alias("count_permit"),
-            ((pl.col("action") == "DENY").cast(pl.Int64)).sum().alias("count_deny"),
-        ]
-    )
+    # Agréger les données par IP source, une ligne par couple (IP source, action)
+    combined_df = source_ip_activity(fingerprint, cube)
 
     # Créer un scatter plot
-    if not df_agg.is_empty():
-        # We need to recreate the aggregation to count distinct destinations per action type
-        permit_agg = (
-            data.filter(pl.col("action") == "PERMIT")
-            .group_by("ipsrc")
-            .agg(
-                [
-                    pl.col("ipdst").n_unique().alias("distinct_destinations"),
-                    pl.count("ipsrc").alias("connections"),
-                ]
-            )
-            .with_columns(pl.lit("PERMIT").alias("action"))
+    if not combined_df.is_empty():
+        # Budget de points : on ne garde que les IP sources les plus actives
+        plotted_df = top_categories(
+            combined_df, "ipsrc", "connections", SCATTER_POINT_BUDGET
         )
-
-        deny_agg = (
-            data.filter(pl.col("action") == "DENY")
-            .group_by("ipsrc")
-            .agg(
-                [
-                    pl.col("ipdst").n_unique().alias("distinct_destinations"),
-                    pl.count("ipsrc").alias("connections"),
-                ]
+        if plotted_df.height < combined_df.height:
+            st.caption(
+                f"Showing the {plotted_df['ipsrc'].n_unique():,} most active source IPs "
+                f"out of {combined_df['ipsrc'].n_unique():,}."
             )
-            .with_columns(pl.lit("DENY").alias("action"))
-        )
-
-        # Combine both datasets
-        combined_df = pl.concat([permit_agg, deny_agg])
 
         # Convert to pandas
-        df_pandas = combined_df.to_pandas()
+        df_pandas = plotted_df.to_pandas()
 
         # Create the scatter plot with two points per IP source (one for PERMIT, one for DENY)
         fig = px.scatter(
@@ -251,6 +240,7 @@ with tab2:
                 "connections": "Number of Connections",
                 "action": "Action",
             },
+            render_mode="webgl",
         )
 
         # Improve layout for better readability
@@ -271,45 +261,36 @@ with tab3:
         "### 🔢 Top 10 ports with authorized access"
         " (portdst < 1024 and action == 'PERMIT')"
     )
-    top_ports = (
-        data.filter((pl.col("portdst").cast(pl.Int64) < 1024) & (pl.col("action") == "PERMIT"))
-        .group_by("portdst")
-        .agg(pl.count("portdst").alias("count"))
-        .sort("count", descending=True)
-        .head(10)
-    )
+    top_ports = top_permitted_ports(fingerprint, cube, max_port=1024, limit=10)
     st.dataframe(top_ports, use_container_width=True)
 
     # Afficher ici le top 5 des IP sources les plus émettrices
     st.write("### 🌐 Top 5 emitting IP addresses (ipsource and action == 'PERMIT')")
-    top_ips = (
-        data.filter(pl.col("action") == "PERMIT")
-        .group_by("ipsrc")
-        .agg(pl.count("ipsrc").alias("count"))
-        .sort("count", descending=True)
-        .head(5)
-    )
+    top_ips = top_sources(fingerprint, cube, "PERMIT", limit=5)
     st.dataframe(top_ips, use_container_width=True)
+    if "upper_bound" in top_ips.columns:
+        st.caption(
+            "Approximate counts (heavy-hitters summary): the true count lies between count and upper_bound."
+        )
 
     # Graphique
 
     st.write("### 🔴 Analysis of Blocked Attempts")
 
     if "ipsrc" in data.columns and "action" in data.columns:
-        # Filtrer uniquement les tentatives bloquées
-        blocked_attempts = data.filter(pl.col("action") == "DENY")
-
         # Compter les occurrences des IP sources bloquées
-        blocked_ips = (
-            blocked_attempts.group_by("ipsrc")
-            .agg(pl.count("ipsrc").alias("count"))
-            .sort("count", descending=True)
-        )
+        blocked_ips = top_sources(fingerprint, cube, "DENY")
 
         top_n = st.slider(" ", 5, 20, 10, key="top_n_slider")
 
         # Sélectionner le Top N des IP bloquées
         top_blocked_ips = blocked_ips.head(top_n)
+        approximate = "upper_bound" in top_blocked_ips.columns
+        if approximate:
+            # Barres d'erreur : écart maximal entre le compte estimé et le vrai compte
+            top_blocked_ips = top_blocked_ips.with_columns(
+                (pl.col("upper_bound") - pl.col("count")).alias("error")
+            )
 
         # ---- GRAPHIQUE AVEC PLOTLY ----
         color_palette = px.colors.sequential.Blues
@@ -322,6 +303,7 @@ with tab3:
                 text="count",
                 title=f"Top {top_n} Most Blocked IPs",
                 labels={"ipsrc": "IP Source", "count": "Number of Blocked Attempts"},
+                error_x="error" if approximate else None,
                 color_discrete_sequence=["#3d85c6"],
             )
 
@@ -339,41 +321,54 @@ with tab3:
     # Graphique de série temporelle des connexions par heure
     st.write("### 📊 Connection Activity Analysis")
     if "timestamp" in data.columns:
+        # Pyramide de comptages (seconde, minute, heure, jour) construite une fois par jeu de données
+        pyramid = st.session_state.dataset_handle.derived(
+            "time_pyramid:timestamp", build_time_pyramid
+        )
+
         # 📌 Ajout d'un sélecteur de fréquence
         frequency = st.selectbox(
-            "Select frequency", ["second", "minute", "hour", "day"], index=1
+            "Select frequency", ["auto", "second", "minute", "hour", "day"], index=0
         )
 
-        # Définition des formats selon la fréquence choisie
-        if frequency == "second":
-            time_format = "%Y-%m-%d %H:%M:%S"
-            time_label = "Second"
-        elif frequency == "minute":
-            time_format = "%Y-%m-%d %H:%M:00"
-            time_label = "Minute"
-        elif frequency == "hour":
-            time_format = "%Y-%m-%d %H:00:00"
-            time_label = "Hour"
-        else:
-            time_format = "%Y-%m-%d"
-            time_label = "Day"
+        # Période affichée : le niveau est choisi sur cette plage, un zoom donne des buckets plus fins
+        first_bucket, last_bucket = time_extent(pyramid)
+        range_start, range_end = first_bucket, last_bucket
+        if first_bucket is not None and first_bucket < last_bucket:
+            range_start, range_end = st.slider(
+                "Period",
+                min_value=first_bucket,
+                max_value=last_bucket,
+                value=(first_bucket, last_bucket),
+                format="YYYY-MM-DD HH:mm:ss",
+                key="activity_range",
+            )
 
-        # Filtrage et regroupement
-        activity_data = (
-            data.filter(pl.col("action") == "PERMIT")
-            .with_columns(
-                pl.col("timestamp").dt.strftime(time_format).alias("time_period")
+        # Niveau le plus fin dont le nombre de points tient dans le budget du graphique
+        level = select_level(
+            pyramid,
+            range_start,
+            range_end,
+            finest="second" if frequency == "auto" else frequency,
+        )
+        if frequency not in ("auto", level):
+            st.caption(
+                f"Too many points at the {frequency} level for this period, "
+                f"showing the {level} level instead."
             )
-            .group_by("time_period")
-            .agg(pl.count("time_period").alias("connection_count"))
-            .sort("time_period")
+        time_label = level.capitalize()
+
+        # Filtrage et regroupement
+        activity_data = activity_series(
+            fingerprint, pyramid, level, start=range_start, end=range_end
         )
 
         # Vérifier s'il y a des données
         if not activity_data.is_empty():
-            # Convertir en Pandas
-            df_activity = activity_data.to_pandas()
-            df_activity["time_period"] = pd.to_datetime(df_activity["time_period"])
+            # Réduction LTTB à un budget fixe de points, puis conversion en Pandas
+            df_activity = downsample_line(
+                activity_data, "time_period", "connection_count", LINE_POINT_BUDGET
+            ).to_pandas()
 
             # Tracer le graphique
             fig = px.line(
@@ -386,7 +381,7 @@ with tab3:
                     "time_period": time_label,
                     "connection_count": "Number of Connections",
                 },
-                line_shape="spline",
+                render_mode="webgl",
             )
 
             # Afficher le graphique
@@ -402,25 +397,13 @@ with tab4:
     st.subheader("🚫 List of access outside the university network")
 
     if "ipsrc" in data.columns and "action" in data.columns:
-        # Conversion des IPs en chaînes de caractères pour éviter les erreurs de type
-        data = data.with_columns(
-            [
-                pl.col("ipsrc").cast(pl.Utf8).alias("ipsrc"),
-                pl.col("action").cast(pl.Utf8).alias("action"),
-            ]
-        )
-
-        # Vérification des IPs avec la fonction is_university_ip
-        data = data.with_columns(
-            [
-                pl.col("ipsrc")
-                .map_elements(is_university_ip, return_dtype=pl.Boolean)
-                .alias("is_src_university_ip")
-            ]
-        )
+        # Vérification des IPs avec la fonction is_university_ip (une fois par IP distincte)
+        university_ips = university_source_ips(fingerprint, cube)
 
         # filtrer toutes les connexions impliquant une adresse externe
-        intrusion_attempts = data.filter((~pl.col("is_src_university_ip")))
+        intrusion_attempts = data.filter(
+            ~pl.col("ipsrc").cast(pl.Utf8).is_in(university_ips)
+        )
         # Ajout d'un filtre par action
         selected_action = st.selectbox("Select action type", ["All", "PERMIT", "DENY"])
 
@@ -430,9 +413,7 @@ with tab4:
             )
         # Affichage des accès externes
         st.write(f"### 🔍 External accesses: {intrusion_attempts.shape[0]} entries")
-        st.dataframe(
-            intrusion_attempts.drop(["is_src_university_ip"]), use_container_width=True
-        )
+        paginated_dataframe(intrusion_attempts, key="foreign_ip_grid")
 
     else:
         st.warning("Columns 'ipsrc' not found.")
@@ -442,20 +423,18 @@ with tab4:
 with tab5:
     st.subheader("Sankey Diagram")
 
-    def create_sankey(df, source_col, target_col):
-        """Crée un diagramme de Sankey entre deux colonnes"""
-        df_grouped = df.group_by([source_col, target_col]).len().to_pandas()
+    # Nombre de flux les plus importants conservés, les autres sont regroupés en nœuds "Other"
+    top_k = st.slider(
+        "Number of heaviest flows kept", 5, 100, SANKEY_TOP_K, key="sankey_top_k"
+    )
 
-        # Création des nœuds
-        labels = list(
-            pd.concat([df_grouped[source_col], df_grouped[target_col]]).unique()
-        )
-        label_to_index = {label: i for i, label in enumerate(labels)}
+    def create_sankey(action, source_col, target_col):
+        """Crée un diagramme de Sankey entre deux colonnes"""
+        flows = flow_counts(fingerprint, cube, action, source_col, target_col)
+        links = prune_flows(flows, source_col, target_col, k=top_k)
 
-        # Création des liens
-        sources = df_grouped[source_col].map(label_to_index)
-        targets = df_grouped[target_col].map(label_to_index)
-        values = df_grouped["len"]
+        # Création des nœuds et des liens
+        labels, sources, targets, values = sankey_links(links, source_col, target_col)
 
         # Création du Sankey Diagram
         fig = go.Figure(
@@ -477,24 +456,16 @@ with tab5:
 
     st.subheader("Connections where access were identified as : PERMIT")
 
-    data_filtered = data.filter(pl.col("action") == "PERMIT")
     # 🔹 Sankey entre IP source et IP destination
-    create_sankey(data_filtered, "ipsrc", "ipdst")
+    create_sankey("PERMIT", "ipsrc", "ipdst")
 
     # 🔹 Sankey entre IP source et port destination
-    df = data_filtered.with_columns(
-        data_filtered["portdst"]
-    ) 
-    create_sankey(df, "ipsrc", "portdst")
+    create_sankey("PERMIT", "ipsrc", "portdst")
 
     st.subheader("Connections where access were identified as : DENY")
 
-    data_filtered = data.filter(pl.col("action") == "DENY")
     # 🔹 Sankey entre IP source et IP destination
-    create_sankey(data_filtered, "ipsrc", "ipdst")
+    create_sankey("DENY", "ipsrc", "ipdst")
 
     # 🔹 Sankey entre IP source et port destination
-    df = data_filtered.with_columns(
-        data_filtered["portdst"]
-    )
-    create_sankey(df, "ipsrc", "portdst")
+    create_sankey("DENY", "ipsrc", "portdst")
@@ -0,0 +1,86 @@
+import streamlit as st
+
+from utils.grid import paginated_dataframe
+from utils.sql_console import (
+    SQL_ROW_LIMIT,
+    SQL_TABLE,
+    SQL_TIMEOUT,
+    explain_analyze,
+    normalize_query,
+    run_query,
+)
+
+st.title("🧮 SQL Console")
+
+if "parsed_df" not in st.session_state or st.session_state.parsed_df is None:
+    st.info("Please upload a log file on the 'Upload' page.")
+    st.stop()
+
+df = st.session_state.parsed_df
+fingerprint = st.session_state.dataset_handle.key
+
+st.caption(
+    f"The loaded dataset is the table `{SQL_TABLE}` ({df.height:,} rows). "
+    "Queries run in DuckDB on the data in memory, without copying it; "
+    "files and extensions are not accessible."
+)
+with st.expander("Columns"):
+    st.write(", ".join(f"`{name}` ({dtype})" for name, dtype in df.schema.items()))
+
+sql = st.text_area(
+    "Query",
+    value=f"SELECT * FROM {SQL_TABLE} LIMIT 100",
+    height=150,
+    key="sql_query",
+)
+col1, col2, col3, col4 = st.columns([2, 2, 1, 2])
+with col1:
+    row_limit = st.number_input(
+        "Row limit", 1, 1_000_000, SQL_ROW_LIMIT, step=1_000, key="sql_row_limit"
+    )
+with col2:
+    timeout = st.number_input(
+        "Timeout (s)", 1, 600, SQL_TIMEOUT, step=5, key="sql_timeout"
+    )
+with col3:
+    st.write("")
+    run = st.button("Run", type="primary")
+with col4:
+    st.write("")
+    explain = st.button("Explain analyze")
+
+# The submitted query is kept so the result stays visible while the grid is used
+if run or explain:
+    st.session_state.sql_submitted = sql
+submitted = st.session_state.get("sql_submitted")
+
+if submitted and normalize_query(submitted):
+    try:
+        if explain:
+            with st.spinner("Profiling the query..."):
+                plan = explain_analyze(df, submitted, timeout)
+            st.subheader("Query profile")
+            st.code(plan, language=None)
+        else:
+            with st.spinner("Running the query..."):
+                output = run_query(
+                    fingerprint,
+                    normalize_query(submitted),
+                    row_limit,
+                    df,
+                    submitted,
+                    timeout,
+                )
+            result = output["result"]
+            if result.width == 0:
+                st.success(f"Statement executed in {output['seconds']:.3f} s.")
+            else:
+                message = f"{len(result):,} rows in {output['seconds']:.3f} s"
+                if output["truncated"]:
+                    message += f" (limited to the first {row_limit:,} rows)"
+                st.caption(message)
+                paginated_dataframe(result, key="sql_result_grid")
+    except TimeoutError as e:
+        st.error(str(e))
+    except Exception as e:
+        st.error(f"Query failed: {e}")
@@ -1,6 +1,8 @@
 import streamlit as st
 import polars as pl
 
+from utils.dataset_profile import profile_dataset
+
 # Perform a statistical analysis
 st.title("Statistical Analysis")
 
@@ -9,6 +11,23 @@ if st.session_state.parsed_df is None:
     st.info("Please upload a log file on the 'Upload' page.")
     st.stop()
 
+df = st.session_state.parsed_df
+# Every figure below comes from this profile, computed in one query per dataset and shared
+handle = st.session_state.dataset_handle
+profile = handle.derived("profile", lambda frame: profile_dataset(handle))
+column_stats = profile["columns"]
+if profile["batches"] > 1:
+    st.info(
+        f"Statistics of {profile['batches']} appended batches ({profile['rows']:,} rows), merged "
+        "without reading the data again: distinct counts and most common values are estimated "
+        "with sketches, quartiles and histograms with a sample of the values."
+    )
+elif profile["approximate"]:
+    st.info(
+        f"Large dataset ({profile['rows']:,} rows): distinct counts and most common values "
+        "are estimated with mergeable sketches (HyperLogLog and heavy-hitters summaries)."
+    )
+
 # Create tabs for different statistical views
 stat_tab1, stat_tab2, stat_tab3 = st.tabs(
     ["General Information", "Numerical Statistics", "Categorical Variables"]
@@ -18,19 +37,20 @@ with stat_tab1:
     st.write("### Dataset Overview")
 
     # Show basic dataframe information
-    df = st.session_state.parsed_df
     col1, col2 = st.columns(2)
 
     with col1:
-        st.metric("Number of Rows", df.height)
+        st.metric("Number of Rows", profile["rows"])
         st.metric(
             "Memory Usage",
-            f"{df.estimated_size() / (1024 * 1024):.2f} MB",
+            f"{profile['size_bytes'] / (1024 * 1024):.2f} MB",
         )
 
     with col2:
-        st.metric("Number of Columns", df.width)
-        st.metric("Missing Values", sum(df.null_count().row(0)))
+        st.metric("Number of Columns", len(column_stats))
+        st.metric(
+            "Missing Values", sum(stats["nulls"] for stats in column_stats.values())
+        )
 
     # Display data types distribution
     dtypes_dict = {
@@ -55,22 +75,8 @@ with stat_tab2:
     st.write("### Numerical Summary Statistics")
 
     # Get numeric columns
-    numeric_dtypes = {
-        pl.Int8,
-        pl.Int16,
-        pl.Int32,
-        pl.Int64,
-        pl.UInt8,
-        pl.UInt16,
-        pl.UInt32,
-        pl.UInt64,
-        pl.Float32,
-        pl.Float64,
-    }
     numeric_cols = [
-        name
-        for name, dtype in zip(df.columns, df.schema.values())
-        if dtype in numeric_dtypes
+        name for name, stats in column_stats.items() if stats["kind"] == "numeric"
     ]
 
     if numeric_cols:
@@ -82,21 +88,40 @@ with stat_tab2:
         )
 
         if selected_cols:
-            # Show detailed stats
-            detailed_stats = df.select(selected_cols).describe()
+            # Show detailed stats (same layout as DataFrame.describe)
+            statistics = ["nulls", "mean", "std", "min", "25%", "50%", "75%", "max"]
+            detailed_stats = pl.DataFrame(
+                {
+                    "statistic": ["count", "null_count", *statistics[1:]],
+                    **{
+                        col: [
+                            profile["rows"] - column_stats[col]["nulls"],
+                            *(column_stats[col][stat] for stat in statistics),
+                        ]
+                        for col in selected_cols
+                    },
+                },
+                schema_overrides={col: pl.Float64 for col in selected_cols},
+                strict=False,
+            )
             st.dataframe(detailed_stats, use_container_width=True)
+
+            st.write("### Distributions")
+            for col in selected_cols:
+                st.caption(col)
+                st.bar_chart(
+                    column_stats[col]["histogram"],
+                    x="breakpoint",
+                    y="count",
+                    height=200,
+                )
     else:
         st.info("No numerical columns available for analysis.")
 
     # Add datetime variables analysis section
     st.write("### Datetime Variables Analysis")
 
-    datetime_dtypes = {pl.Date, pl.Datetime, pl.Time, pl.Duration}
-    datetime_cols = [
-        name
-        for name, dtype in zip(df.columns, df.schema.values())
-        if dtype in datetime_dtypes
-    ]
+    datetime_cols = [name for name, stats in column_stats.items() if "dates" in stats]
 
     if datetime_cols:
         # Allow user to select which datetime columns to analyze
@@ -109,12 +134,12 @@ with stat_tab2:
         if selected_dt_cols:
             for col in selected_dt_cols:
                 with st.expander(f"Datetime analysis: {col}", expanded=True):
-                    series = df.filter(pl.col(col).is_not_null()).select(pl.col(col))
+                    stats = column_stats[col]
 
-                    if series.height > 0:
+                    if stats["nulls"] < profile["rows"]:
                         # Calculate basic datetime statistics
-                        min_date = series.select(pl.col(col).min()).item()
-                        max_date = series.select(pl.col(col).max()).item()
+                        min_date = stats["min"]
+                        max_date = stats["max"]
                         time_span = max_date - min_date
 
                         # Display key metrics
@@ -135,45 +160,23 @@ with stat_tab2:
                         # Additional datetime metrics
                         col1, col2, col3 = st.columns(3)
                         with col1:
-                            st.metric(
-                                "Unique Dates",
-                                df.select(pl.col(col).dt.date()).n_unique(),
-                            )
+                            st.metric("Unique Dates", stats["dates"])
                         with col2:
-                            missing = df.select(pl.col(col).is_null().sum()).item()
+                            missing = stats["nulls"]
                             st.metric(
                                 "Missing Values",
                                 missing,
-                                f"{missing / df.height * 100:.2f}%",
+                                f"{missing / profile['rows'] * 100:.2f}%",
                             )
                         with col3:
-                            st.metric(
-                                "Unique Months",
-                                df.select(pl.col(col).dt.month()).n_unique(),
-                            )
+                            st.metric("Unique Months", stats["months"])
                     else:
                         st.warning(f"No valid datetime values in column '{col}'")
     else:
         st.info("No datetime columns available for analysis.")
 
 with stat_tab3:
-    numeric_dtypes = {
-        pl.Int8,
-        pl.Int16,
-        pl.Int32,
-        pl.Int64,
-        pl.UInt8,
-        pl.UInt16,
-        pl.UInt32,
-        pl.UInt64,
-        pl.Float32,
-        pl.Float64,
-    }
-    non_numeric_cols = [
-        name
-        for name, dtype in zip(df.columns, df.schema.values())
-        if dtype not in numeric_dtypes
-    ]
+    non_numeric_cols = [name for name, stats in column_stats.items() if "top" in stats]
 
     if non_numeric_cols:
         st.write("### Categorical Variables Analysis")
@@ -185,34 +188,30 @@ with stat_tab3:
 
         if selected_cat_cols:
             for col in selected_cat_cols:
-                unique_count = df.select(pl.col(col)).n_unique()
+                stats = column_stats[col]
+                unique_count = stats["distinct"]
+                if "distinct_error" in stats:
+                    unique_count = (
+                        f"~{unique_count} (±{stats['distinct_error'] * 100:.1f}%)"
+                    )
                 with st.expander(f"{col} - {unique_count} unique values"):
-                    # Show value counts if not too many unique values
-                    if unique_count <= 20:
-                        st.write(
-                            df.select(pl.col(col).value_counts().struct.unnest()).sort(
-                                "count", descending=True
-                            )
+                    if "upper_bound" in stats["top"].columns:
+                        st.caption(
+                            "Approximate counts: the true count lies between count and upper_bound."
                         )
+                    # Show value counts if not too many unique values
+                    if stats["distinct"] <= 20:
+                        st.write(stats["top"])
                     else:
-                        # Avec votre variable 'col' (remplacez 'col' par le nom réel de votre colonne)
                         st.write(f"Top 10 most common values (out of {unique_count})")
-                        st.write(
-                            df.select(
-                                pl.col(col)
-                                .value_counts()
-                                .struct.unnest()  # Déstructure la struct ici
-                            )
-                            .sort("count", descending=True)
-                            .head(10)
-                        )
+                        st.write(stats["top"].head(10))
 
                     # Show missing values for this column
-                    missing = df.select(pl.col(col).is_null().sum()).item()
+                    missing = stats["nulls"]
                     st.metric(
                         "Missing values",
                         missing,
-                        f"{missing / df.height * 100:.2f}%",
+                        f"{missing / profile['rows'] * 100:.2f}%",
                     )
     else:
         st.info("No categorical or text columns available for analysis.")
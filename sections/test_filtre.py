@@ -1,15 +1,10 @@
 import streamlit as st
 import pandas as pd
-import ipaddress
+import polars as pl
 import plotly.express as px
 import os
 
-# 📌 Définition du plan d'adressage de l'Université
-UNIVERSITY_IP_RANGES = [
-    "192.168.0.0/16",
-    "10.0.0.0/8",
-    "172.16.0.0/12"
-]
+from utils.subnets import get_subnet_registry
 
 # 📌 Fichier cache pour accélérer les chargements suivants
 CACHE_FILE = "logs_cache.parquet"
@@ -49,7 +44,8 @@ def process_logs(df):
     df_top_ports.columns = ["portdest", "count"]
 
     # 🚫 3️⃣ Lister les accès hors plan d’adressage universitaire
-    df["is_outside"] = df["ipsource"].apply(lambda ip: not any(ipaddress.ip_address(ip) in ipaddress.ip_network(net) for net in UNIVERSITY_IP_RANGES))
+    # Plan d'adressage défini dans config/subnet_definitions.py, classification vectorisée
+    df["is_outside"] = ~get_subnet_registry().is_internal(pl.Series(df["ipsource"])).to_numpy()
     df_outside_university = df[df["is_outside"]]
 
     return df_top_ips, df_top_ports, df_outside_university
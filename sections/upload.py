@@ -6,6 +6,12 @@ from datetime import datetime
 import polars as pl
 import streamlit as st
 
+from utils.alert_scheduler import get_alert_scheduler
+from utils.cube import build_traffic_cube
+from utils.dataset_profile import profile_dataset
+from utils.dataset_store import dataset_fingerprint, get_dataset_store
+from utils.time_index import sort_by_time
+
 st.title("ShadowLog - Log File Analyzer")
 st.write("Upload a log file to analyze with the following format :")
 st.write(
@@ -60,53 +66,141 @@ apply_date_filter = st.checkbox(
     "Apply date filtering (Nov 1, 2024 - Mar 1, 2025)", value=True
 )
 
-uploaded_file = st.file_uploader("Choose a log file")
-
 if "parsed_df" not in st.session_state:
     st.session_state.parsed_df = None
 
-if uploaded_file is not None:
-    with st.spinner("Parsing and filtering the file..."):
-        try:
-            # Read the CSV
-            st.session_state.parsed_df = pl.read_csv(
-                uploaded_file,
-                separator=";",
-                has_header=False,
-                infer_schema_length=10000,
-                dtypes={
-                    "timestamp": pl.Datetime,
-                    "ipsrc": pl.Utf8,
-                    "ipdst": pl.Utf8,
-                    "protocole": pl.Utf8,
-                    "portsrc": pl.Utf8,
-                    "portdst": pl.Utf8,
-                    "rule": pl.Utf8,
-                    "action": pl.Utf8,
-                    "interface": pl.Utf8,
-                    "unknown": pl.Utf8,
-                    "fw": pl.Int64,
-                },
-            ).drop(["portsrc", "unknown", "fw"])
-
-            # Apply date filter only if checkbox is checked
-            if apply_date_filter:
-                st.session_state.parsed_df = st.session_state.parsed_df.filter(
-                    (pl.col("timestamp") >= pl.datetime(2024, 11, 1))
-                    & (pl.col("timestamp") < pl.datetime(2025, 3, 1))
-                )
+if "dataset_handle" not in st.session_state:
+    st.session_state.dataset_handle = None
 
-            row_count = st.session_state.parsed_df.height
-            if row_count == 0:
-                st.error(
-                    "No data found in the file. Try uncheck the date filter option."
-                )
-            else:
-                st.success(
-                    f"File parsed and filtered successfully! After filtering, {row_count:,} rows remain."
-                )
-        except Exception as e:
-            st.error(f"Error parsing the file: {e}")
+# New logs of the same firewall can be appended to the dataset being analyzed
+append_to_dataset = st.session_state.dataset_handle is not None and st.checkbox(
+    "Append to the currently loaded dataset", value=False
+)
+
+uploaded_file = st.file_uploader("Choose a log file")
+
+
+def parse_log_file(file, date_filter):
+    """Parse the uploaded firewall log into a polars DataFrame."""
+    df = pl.read_csv(
+        file,
+        separator=";",
+        has_header=False,
+        infer_schema_length=10000,
+        dtypes={
+            "timestamp": pl.Datetime,
+            "ipsrc": pl.Utf8,
+            "ipdst": pl.Utf8,
+            "protocole": pl.Utf8,
+            "portsrc": pl.Utf8,
+            "portdst": pl.Utf8,
+            "rule": pl.Utf8,
+            "action": pl.Utf8,
+            "interface": pl.Utf8,
+            "unknown": pl.Utf8,
+            "fw": pl.Int64,
+        },
+    ).drop(["portsrc", "unknown", "fw"])
+
+    # Apply date filter only if checkbox is checked
+    if date_filter:
+        df = df.filter(
+            (pl.col("timestamp") >= pl.datetime(2024, 11, 1))
+            & (pl.col("timestamp") < pl.datetime(2025, 3, 1))
+        )
+
+    # Sorting once here lets every page select time ranges by binary search
+    return sort_by_time(df)
+
+
+def append_dataset(store, parent, file, date_filter):
+    """
+    Store the rows of file appended to the parent dataset and return a handle on the result.
+    When the new rows all come after the parent ones, the parent stays a prefix of the result,
+    so its lineage is recorded and analyses can be extended instead of recomputed.
+    """
+    fingerprint = dataset_fingerprint(file, date_filter, "append", parent.key)
+    handle = store.get(fingerprint)
+    if handle is not None:
+        return handle
+    new_rows = parse_log_file(file, date_filter)
+    combined = pl.concat([parent.df, new_rows], how="vertical_relaxed")
+    first_new, last_old = new_rows["timestamp"].min(), parent.df["timestamp"].max()
+    if first_new is None or last_old is None or first_new >= last_old:
+        if combined["timestamp"].null_count() == 0:
+            # Both parts are sorted and in order: keep the binary-search slicing of the pages
+            combined = combined.with_columns(pl.col("timestamp").set_sorted())
+        return store.put(fingerprint, combined, parent=parent.key)
+    # Overlapping time ranges: the rows have to be re-sorted, the parent is no longer a prefix
+    return store.put(fingerprint, sort_by_time(combined))
+
+
+def set_dataset(handle):
+    """
+    Point the session at a shared dataset, releasing the one it held before, and start evaluating
+    its alerts in the background (before the alerts page is opened).
+    """
+    previous = st.session_state.dataset_handle
+    if previous is not None and previous.key == handle.key:
+        # Same dataset: keep the existing reference and drop the new one
+        handle.release()
+        handle = previous
+    scheduler = get_alert_scheduler()
+    # Tracked before the previous dataset is untracked: a stream continued by an append keeps its state
+    scheduler.track(handle)
+    if previous is not None and previous is not handle:
+        scheduler.untrack(previous)
+        previous.release()
+    st.session_state.dataset_handle = handle
+    st.session_state.parsed_df = handle.df
+
+
+if uploaded_file is not None:
+    upload_signature = (uploaded_file.file_id, apply_date_filter, append_to_dataset)
+    # Streamlit reruns this page on every interaction: only hash and parse a new upload once
+    if st.session_state.get("upload_signature") != upload_signature:
+        with st.spinner("Parsing and filtering the file..."):
+            try:
+                store = get_dataset_store()
+                if append_to_dataset:
+                    handle = append_dataset(
+                        store,
+                        st.session_state.dataset_handle,
+                        uploaded_file,
+                        apply_date_filter,
+                    )
+                else:
+                    fingerprint = dataset_fingerprint(uploaded_file, apply_date_filter)
+                    handle = store.get(fingerprint)
+                    if handle is None:
+                        handle = store.put(
+                            fingerprint,
+                            parse_log_file(uploaded_file, apply_date_filter),
+                        )
+                set_dataset(handle)
+                # Materialize the aggregate cube shared by the analysis tabs
+                handle.derived("traffic_cube", build_traffic_cube)
+                # Column statistics of the statistics page, merged into the saved profile on append
+                handle.derived("profile", lambda frame: profile_dataset(handle))
+                st.session_state.upload_signature = upload_signature
+            except Exception as e:
+                st.error(f"Error parsing the file: {e}")
+
+    if st.session_state.get("upload_signature") == upload_signature:
+        row_count = st.session_state.parsed_df.height
+        if row_count == 0:
+            st.error("No data found in the file. Try uncheck the date filter option.")
+        else:
+            st.success(
+                f"File parsed and filtered successfully! After filtering, {row_count:,} rows remain."
+            )
+            # Datasets are shared by every session of the process (see utils/dataset_store.py)
+            stored = get_dataset_store().stats()
+            st.caption(
+                f"{len(stored)} datasets in memory for all sessions "
+                f"({sum(entry['size_bytes'] for entry in stored) / 2**20:,.0f} MB), "
+                f"referenced {sum(entry['refcount'] for entry in stored)} times."
+            )
 
     if st.session_state.parsed_df is not None:
         if st.button("Convert to SQLite"):
@@ -0,0 +1,49 @@
+from datetime import datetime
+
+import polars as pl
+
+from utils.alert_rules import ALERT_SCHEMA, AlertRuleEngine
+
+DENY_RULE = {
+    "name": "Denied",
+    "where": [{"column": "action", "op": "==", "value": "DENY"}],
+    "group_by": ["ipsrc"],
+    "window": "5m",
+    "threshold": 0,
+}
+
+
+def test_single_matching_row():
+    # One matching row in a grouped rule used to panic in group_by_dynamic
+    df = pl.DataFrame(
+        {
+            "timestamp": [datetime(2024, 1, 1, 0, 3, 12)],
+            "ipsrc": ["8.8.8.8"],
+            "action": ["DENY"],
+        }
+    )
+    alerts = AlertRuleEngine([DENY_RULE]).evaluate(df, "timestamp")
+    assert alerts.schema == pl.Schema(ALERT_SCHEMA)
+    assert alerts.rows() == [
+        ("Denied", "medium", datetime(2024, 1, 1, 0, 0), "ipsrc=8.8.8.8", 1.0, 0.0)
+    ]
+
+
+def test_tumbling_windows_per_key():
+    df = pl.DataFrame(
+        {
+            "timestamp": [
+                datetime(2024, 1, 1, 0, 6),
+                datetime(2024, 1, 1, 0, 1),
+                datetime(2024, 1, 1, 0, 4, 59),
+                datetime(2024, 1, 1, 0, 2),
+            ],
+            "ipsrc": ["a", "a", "a", "b"],
+            "action": ["DENY", "DENY", "DENY", "PERMIT"],
+        }
+    )
+    rule = dict(DENY_RULE, threshold=1)
+    alerts = AlertRuleEngine([rule]).evaluate(df, "timestamp")
+    assert alerts.select("window_start", "key", "value").rows() == [
+        (datetime(2024, 1, 1, 0, 0), "ipsrc=a", 2.0)
+    ]
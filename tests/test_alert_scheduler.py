@@ -0,0 +1,125 @@
+from datetime import datetime, timedelta
+
+import numpy as np
+import polars as pl
+import pytest
+
+from utils import disk_cache
+from utils.alert_rules import get_alert_rule_engine
+from utils.alert_scheduler import AlertScheduler
+from utils.dataset_store import DatasetStore
+from utils.detectors import run_detectors
+from utils.online_detector import EwmaDetector
+
+APPENDED_AT = datetime(2024, 1, 1, 10, 0, 30)
+
+
+def firewall_logs():
+    """Random traffic from 08:00 to 11:00 and a 60-port scan from 09:58 to 10:02."""
+    rng = np.random.default_rng(0)
+    n = 20_000
+    seconds = np.sort(rng.integers(0, 3 * 3600, n))
+    traffic = pl.DataFrame(
+        {
+            "timestamp": [
+                datetime(2024, 1, 1, 8) + timedelta(seconds=int(s)) for s in seconds
+            ],
+            "ipsrc": rng.choice(["192.168.1.2", "192.168.1.3", "8.8.8.8"], n),
+            "ipdst": rng.choice(["10.0.0.1", "10.0.0.2"], n),
+            "portdst": rng.choice([80, 443], n),
+            "action": rng.choice(["PERMIT", "DENY"], n),
+        }
+    )
+    scan = pl.DataFrame(
+        {
+            "timestamp": [
+                datetime(2024, 1, 1, 9, 58) + timedelta(seconds=4 * i)
+                for i in range(60)
+            ],
+            "ipsrc": ["6.6.6.6"] * 60,
+            "ipdst": ["10.0.0.1"] * 60,
+            "portdst": list(range(1000, 1060)),
+            "action": ["DENY"] * 60,
+        }
+    )
+    return (
+        pl.concat([traffic, scan])
+        .sort("timestamp")
+        .with_columns(pl.col("timestamp").set_sorted())
+    )
+
+
+@pytest.fixture
+def stream(tmp_path, monkeypatch):
+    """A scheduler (no background wake-ups) and a dataset P with its appended child C."""
+    monkeypatch.setattr(disk_cache, "CACHE_DIR", str(tmp_path))
+    store = DatasetStore()
+    monkeypatch.setattr("utils.alert_scheduler.get_dataset_store", lambda: store)
+    logs = firewall_logs()
+    parent = store.put("P", logs.filter(pl.col("timestamp") <= APPENDED_AT))
+    child = store.put("C", logs, parent="P")
+    return AlertScheduler(interval=3600), parent, child
+
+
+def test_append_is_evaluated_like_the_whole_dataset(stream):
+    scheduler, parent, child = stream
+    key = scheduler.track(parent)
+    scheduler.refresh(key)
+    first = scheduler.snapshot(key)
+    assert first["dataset"] == "P" and first["error"] is None
+
+    assert scheduler.track(child) == key
+    scheduler.refresh(key)
+    snapshot = scheduler.snapshot(key)
+    assert snapshot["dataset"] == "C" and snapshot["error"] is None
+    assert snapshot["evaluated_until"] == child.df["timestamp"].max()
+
+    # The scan straddles the rescan start (10:00): its windows see the rows of both batches
+    expected = run_detectors(child.df, "timestamp")
+    assert snapshot["detections"].equals(expected)
+    assert snapshot["detections"].select("detector", "source", "peak").rows() == [
+        ("Vertical port scan", "6.6.6.6", 60)
+    ]
+    columns = ["window_start", "rule", "key"]
+    rules = get_alert_rule_engine().evaluate(child.df, "timestamp")
+    assert snapshot["rules"].sort(columns).equals(rules.sort(columns))
+
+
+def test_parent_does_not_replace_its_child(stream):
+    scheduler, parent, child = stream
+    key = scheduler.track(child)
+    scheduler.refresh(key)
+    until = scheduler.snapshot(key)["evaluated_until"]
+
+    # Another session still on the parent only watches the stream
+    assert scheduler.track(parent) == key
+    scheduler.refresh(key)
+    snapshot = scheduler.snapshot(key)
+    assert snapshot["dataset"] == "C"
+    assert snapshot["evaluated_until"] == until
+    assert {"P", "C"} <= snapshot["datasets"]
+
+
+def test_reset_detector_scores_the_history_again(stream):
+    scheduler, parent, child = stream
+    key = scheduler.track(parent)
+    scheduler.refresh(key)
+    scheduler.track(child)
+    scheduler.refresh(key)
+
+    scheduler.reset_detector(key)
+    assert scheduler.snapshot(key)["detector"] is None
+    scheduler.refresh(key)
+    snapshot = scheduler.snapshot(key)
+
+    fresh = EwmaDetector()
+    fresh.update(child.df, "timestamp")
+    assert snapshot["detector"] == fresh.state()
+    assert snapshot["anomalies"].equals(fresh.anomalies)
+
+
+def test_untrack_releases_the_stream(stream):
+    scheduler, parent, child = stream
+    key = scheduler.track(child)
+    scheduler.untrack(child)
+    assert scheduler.snapshot(key) is None
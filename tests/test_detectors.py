@@ -0,0 +1,44 @@
+from datetime import datetime, timedelta
+
+import polars as pl
+
+from utils.detectors import DETECTION_SCHEMA, brute_force
+
+FAILURE = "Failed password for root from 10.0.0.9 port 22 ssh2"
+
+
+def test_brute_force_burst_in_one_minute():
+    # 60 failures in the same minute collapse to a single (minute, ip) row
+    df = pl.DataFrame(
+        {
+            "timestamp": [datetime(2024, 1, 1, 0, 0, s) for s in range(60)],
+            "Content": [FAILURE] * 60,
+        }
+    )
+    detections = brute_force(df, "timestamp", "Content").collect()
+    assert detections.schema == pl.Schema(DETECTION_SCHEMA)
+    assert detections.rows() == [
+        (
+            "SSH brute force",
+            "10.0.0.9",
+            "60 failures",
+            datetime(2024, 1, 1, 0, 0),
+            datetime(2024, 1, 1, 0, 0),
+            1,
+            60,
+        )
+    ]
+
+
+def test_brute_force_sliding_windows():
+    # 5 failures a minute for 6 minutes: at least 20 in the windows starting at 0:00 to 0:02
+    times = [
+        datetime(2024, 1, 1) + timedelta(minutes=m, seconds=s)
+        for m in range(6)
+        for s in range(0, 50, 10)
+    ]
+    df = pl.DataFrame({"timestamp": times, "Content": [FAILURE] * len(times)})
+    detections = brute_force(df, "timestamp", "Content", min_failures=20).collect()
+    assert detections.select(
+        "first_window", "last_window", "windows", "peak"
+    ).rows() == [(datetime(2024, 1, 1, 0, 0), datetime(2024, 1, 1, 0, 2), 3, 25)]
@@ -0,0 +1,77 @@
+import polars as pl
+import streamlit as st
+
+from utils.cube import rollup
+from utils.sketches import APPROX_ROW_THRESHOLD, HeavyHitters
+from utils.timeseries import level_series
+
+# Every aggregate is cached on (dataset fingerprint, parameters). The frame or cube itself is passed
+# as an underscored argument so Streamlit does not hash it: the fingerprint already identifies it.
+CACHE_ENTRIES = 32
+
+
+@st.cache_data(max_entries=CACHE_ENTRIES, show_spinner=False)
+def source_ip_activity(fingerprint, _cube):
+    """Distinct destinations and connection count per source IP, split between PERMIT and DENY."""
+    return (
+        _cube.lazy()
+        .filter(pl.col("action").is_in(["PERMIT", "DENY"]))
+        .group_by(["ipsrc", "action"])
+        .agg(
+            [
+                pl.col("ipdst").n_unique().alias("distinct_destinations"),
+                pl.col("count").sum().alias("connections"),
+            ]
+        )
+        .with_columns(pl.col(pl.Categorical).cast(pl.Utf8))
+        .sort(["action", "ipsrc"], descending=[True, False])
+        .collect()
+    )
+
+
+@st.cache_data(max_entries=CACHE_ENTRIES, show_spinner=False)
+def top_permitted_ports(fingerprint, _cube, max_port=1024, limit=10):
+    """Most used destination ports below max_port among permitted connections."""
+    return (
+        rollup(
+            _cube,
+            ["portdst"],
+            where=(pl.col("action") == "PERMIT")
+            & (pl.col("portdst").cast(pl.Utf8).cast(pl.Int64, strict=False) < max_port),
+        )
+        .sort("count", descending=True)
+        .head(limit)
+    )
+
+
+@st.cache_data(max_entries=CACHE_ENTRIES, show_spinner=False)
+def top_sources(fingerprint, _cube, action, limit=None):
+    """
+    Source IPs sorted by number of connections with the given action.
+    On cubes above APPROX_ROW_THRESHOLD rows, the counts come from a heavy-hitters summary
+    (at most HEAVY_HITTERS_CAPACITY sources) and an upper_bound column gives their error.
+    """
+    if _cube.height > APPROX_ROW_THRESHOLD:
+        cells = _cube.filter(pl.col("action") == action)
+        sketch = HeavyHitters.from_series(cells["ipsrc"], weights=cells["count"])
+        return sketch.top(limit).rename({"value": "ipsrc"})
+    counts = rollup(_cube, ["ipsrc"], where=pl.col("action") == action).sort(
+        "count", descending=True
+    )
+    return counts if limit is None else counts.head(limit)
+
+
+@st.cache_data(max_entries=CACHE_ENTRIES, show_spinner=False)
+def activity_series(
+    fingerprint, _pyramid, level, action="PERMIT", start=None, end=None
+):
+    """Number of connections with the given action per bucket of a time pyramid level, over [start, end]."""
+    return level_series(_pyramid, level, start, end, split_value=action).rename(
+        {"bucket": "time_period", "count": "connection_count"}
+    )
+
+
+@st.cache_data(max_entries=CACHE_ENTRIES, show_spinner=False)
+def flow_counts(fingerprint, _cube, action, source_col, target_col):
+    """Number of connections between each (source_col, target_col) pair for the given action."""
+    return rollup(_cube, [source_col, target_col], where=pl.col("action") == action)
@@ -0,0 +1,167 @@
+import operator
+
+import polars as pl
+
+from config.alert_rules import alert_rules
+from utils.subnets import get_subnet_registry
+
+COMPARISONS = {
+    "==": operator.eq,
+    "!=": operator.ne,
+    "<": operator.lt,
+    "<=": operator.le,
+    ">": operator.gt,
+    ">=": operator.ge,
+}
+ALERT_SCHEMA = {
+    "rule": pl.Utf8,
+    "severity": pl.Utf8,
+    "window_start": pl.Datetime("us"),
+    "key": pl.Utf8,
+    "value": pl.Float64,
+    "threshold": pl.Float64,
+}
+
+
+class AlertRuleEngine:
+    """
+    A class that compiles declarative alert rules (see config/alert_rules.py) into a single lazy query.
+    Every rule becomes one boolean column computed on a shared scan of the data, and rules with the
+    same grouping keys and window share one aggregation, so an extra rule costs one more mask
+    and one more sum instead of a scan of its own.
+    """
+
+    def __init__(self, rules):
+        self.rules = [dict(rule) for rule in rules]
+
+    @classmethod
+    def from_config(cls, definitions=alert_rules):
+        return cls(definitions["rules"])
+
+    @staticmethod
+    def required_columns(rule):
+        """Return the dataset columns a rule reads (extracted columns excluded)."""
+        extracted = rule.get("extract", {})
+        columns = {condition["column"] for condition in rule.get("where", [])}
+        columns |= {spec["column"] for spec in extracted.values()}
+        columns |= {col for col in rule.get("group_by", []) if col not in extracted}
+        return columns
+
+    def applicable(self, columns):
+        """Return the rules whose columns all exist in the dataset."""
+        return [
+            rule for rule in self.rules if self.required_columns(rule) <= set(columns)
+        ]
+
+    @staticmethod
+    def _condition(condition):
+        column = pl.col(condition["column"])
+        op, value = condition["op"], condition.get("value")
+        if op in ("internal", "external"):
+            internal = column.cast(pl.Utf8).map_batches(
+                get_subnet_registry().is_internal, return_dtype=pl.Boolean
+            )
+            return internal if op == "internal" else ~internal
+        if op == "contains":
+            return column.cast(pl.Utf8).str.contains(f"(?i){value}")
+        if op in ("in", "not in"):
+            matched = column.cast(pl.Utf8).is_in([str(item) for item in value])
+            return matched if op == "in" else ~matched
+        if isinstance(value, (int, float)) and not isinstance(value, bool):
+            return COMPARISONS[op](column.cast(pl.Float64, strict=False), value)
+        return COMPARISONS[op](column.cast(pl.Utf8), str(value))
+
+    def _mask(self, rule):
+        conditions = [self._condition(condition) for condition in rule.get("where", [])]
+        return (
+            pl.all_horizontal(conditions).fill_null(False)
+            if conditions
+            else pl.lit(True)
+        )
+
+    def plan(self, df, time_col):
+        """
+        Return a LazyFrame evaluating every applicable rule on df, with one row per alert:
+        rule, severity, window_start, key (the group values, e.g. "ipsrc=1.2.3.4"), value
+        (count or rate) and threshold.
+        """
+        rules = self.applicable(df.columns)
+        if not rules or time_col not in df.columns:
+            return pl.LazyFrame(schema=ALERT_SCHEMA)
+
+        extracts = {
+            name: pl.col(spec["column"]).cast(pl.Utf8).str.extract(spec["pattern"], 1)
+            for rule in rules
+            for name, spec in rule.get("extract", {}).items()
+        }
+        masks = {f"rule_{i}": self._mask(rule) for i, rule in enumerate(rules)}
+        base = (
+            df.lazy()
+            .filter(pl.col(time_col).is_not_null())
+            .with_columns(**extracts)
+            .with_columns(**masks)
+        )
+
+        # One aggregation per distinct (grouping keys, window), shared by its rules
+        shared = {}
+        for i, rule in enumerate(rules):
+            keys = tuple(rule.get("group_by", []))
+            shared.setdefault((keys, rule["window"]), []).append(i)
+
+        alerts = []
+        for (keys, window), indices in shared.items():
+            query = base
+            if keys:
+                query = query.filter(pl.all_horizontal(pl.col(keys).is_not_null()))
+            if all(rules[i].get("metric", "count") == "count" for i in indices):
+                # Only counts are needed: rows matched by none of these rules can be dropped early
+                query = query.filter(
+                    pl.any_horizontal(pl.col(f"rule_{i}") for i in indices)
+                )
+            # Tumbling windows: each row falls in the window its truncated time starts
+            windows = query.group_by(*keys, pl.col(time_col).dt.truncate(window)).agg(
+                pl.len().alias("rows"),
+                *[pl.col(f"rule_{i}").sum().alias(f"rule_{i}") for i in indices],
+            )
+            key = (
+                pl.concat_str(
+                    [pl.format(f"{col}={{}}", pl.col(col)) for col in keys],
+                    separator=", ",
+                )
+                if keys
+                else pl.lit(None, dtype=pl.Utf8)
+            )
+            for i in indices:
+                rule = rules[i]
+                value = pl.col(f"rule_{i}").cast(pl.Float64)
+                if rule.get("metric", "count") == "rate":
+                    value = value / pl.col("rows")
+                alerts.append(
+                    windows.filter(
+                        (value > rule["threshold"])
+                        & (pl.col("rows") >= rule.get("min_rows", 1))
+                    ).select(
+                        pl.lit(rule["name"]).alias("rule"),
+                        pl.lit(rule.get("severity", "medium")).alias("severity"),
+                        pl.col(time_col).cast(pl.Datetime("us")).alias("window_start"),
+                        key.alias("key"),
+                        value.alias("value"),
+                        pl.lit(float(rule["threshold"])).alias("threshold"),
+                    )
+                )
+        return pl.concat(alerts, how="vertical").sort(["window_start", "rule", "key"])
+
+    def evaluate(self, df, time_col):
+        """Run the plan of every applicable rule in a single query and return the alerts."""
+        return self.plan(df, time_col).collect()
+
+
+_engine = None
+
+
+def get_alert_rule_engine():
+    """Return the engine compiled from config/alert_rules.py (built once per process)."""
+    global _engine
+    if _engine is None:
+        _engine = AlertRuleEngine.from_config()
+    return _engine
@@ -0,0 +1,363 @@
+import os
+import threading
+import time
+import weakref
+from datetime import datetime
+
+import polars as pl
+
+from utils.alert_rules import ALERT_SCHEMA, get_alert_rule_engine
+from utils.alerts import find_message_column, find_time_column
+from utils.dataset_store import get_dataset_store
+from utils.detectors import (
+    BRUTE_FORCE_WINDOW,
+    DETECTION_SCHEMA,
+    SCAN_WINDOW,
+    WINDOW_SCHEMA,
+    detection_windows,
+    summarize_windows,
+)
+from utils.online_detector import (
+    ANOMALY_SCHEMA,
+    load_detector,
+    reset_detector,
+    save_detector,
+    stream_key,
+)
+from utils.time_index import time_slice
+
+# Seconds between two evaluations of a stream
+ALERT_INTERVAL = float(os.environ.get("SHADOWLOG_ALERT_INTERVAL", 60))
+# A stream nobody looked at for this long (seconds) stops its thread and releases its dataset,
+# even if a session still holds it (override with SHADOWLOG_ALERT_IDLE_TIMEOUT)
+ALERT_IDLE_TIMEOUT = float(os.environ.get("SHADOWLOG_ALERT_IDLE_TIMEOUT", 5 * 60))
+# New data is re-evaluated from the start of this bucket: rule windows and detector steps
+# must divide it, so the windows starting after it only see rows after it
+RESCAN_EVERY = "1h"
+# Sliding detector windows starting this long before the rescan still see the new rows:
+# they are computed again too
+DETECTION_LOOKBACK = (SCAN_WINDOW, BRUTE_FORCE_WINDOW)
+# Rows kept in the alerts table of a stream (the most recent ones)
+ALERT_TABLE_ROWS = 500
+ALERT_TABLE_SCHEMA = {
+    "time": pl.Datetime("us"),
+    "kind": pl.Utf8,
+    "name": pl.Utf8,
+    "severity": pl.Utf8,
+    "key": pl.Utf8,
+    "value": pl.Float64,
+}
+
+
+def alert_table(rules, detections, anomalies):
+    """Gather rule alerts, detections and online anomalies in one table (see ALERT_TABLE_SCHEMA)."""
+    return pl.concat(
+        [
+            rules.select(
+                pl.col("window_start").alias("time"),
+                pl.lit("rule").alias("kind"),
+                pl.col("rule").alias("name"),
+                "severity",
+                "key",
+                "value",
+            ),
+            detections.select(
+                pl.col("first_window").alias("time"),
+                pl.lit("detector").alias("kind"),
+                pl.col("detector").alias("name"),
+                pl.lit("high").alias("severity"),
+                pl.format("{} -> {}", "source", "target").alias("key"),
+                pl.col("peak").cast(pl.Float64).alias("value"),
+            ),
+            anomalies.select(
+                pl.col("bucket").alias("time"),
+                pl.lit("anomaly").alias("kind"),
+                pl.lit("Unusual activity").alias("name"),
+                pl.lit("medium").alias("severity"),
+                pl.lit(None, dtype=pl.Utf8).alias("key"),
+                pl.col("count").cast(pl.Float64).alias("value"),
+            ),
+        ],
+        how="vertical",
+    ).sort("time", descending=True)
+
+
+class AlertStream:
+    """
+    Alert state of one event stream (a dataset and the datasets appended to it): the latest
+    dataset, how far it was evaluated and the results, updated by a background thread.
+    """
+
+    def __init__(self, key, time_col):
+        self.key = key
+        self.time_col = time_col
+        self.handle = None
+        self.evaluated_key = None
+        # The evaluated dataset and the datasets it was appended to
+        self.evaluated_keys = frozenset()
+        self.evaluated_until = None
+        self.rules = pl.DataFrame(schema=ALERT_SCHEMA)
+        self.detections = pl.DataFrame(schema=DETECTION_SCHEMA)
+        # Flagged detector windows, merged by (detector, source, target) into the detections
+        self.windows = pl.DataFrame(schema=WINDOW_SCHEMA)
+        self.anomalies = pl.DataFrame(schema=ANOMALY_SCHEMA)
+        self.table = pl.DataFrame(schema=ALERT_TABLE_SCHEMA)
+        self.detector = None
+        # Session handles on datasets of the stream: it is evaluated while one of them is alive
+        self.watchers = []
+        # Incremented after every evaluation that changed the results: sessions compare it
+        self.version = 0
+        self.new_alerts = 0
+        self.evaluated_at = None
+        self.error = None
+        self.last_seen = time.monotonic()
+        self.wake = threading.Event()
+        self.evaluating = threading.Lock()
+        self.thread = None
+
+    def snapshot(self):
+        """Return the results as a plain dict, for the pages."""
+        return {
+            "dataset": self.evaluated_key,
+            "datasets": self.evaluated_keys,
+            "version": self.version,
+            "new_alerts": self.new_alerts,
+            "evaluated_at": self.evaluated_at,
+            "evaluated_until": self.evaluated_until,
+            "error": self.error,
+            "rules": self.rules,
+            "detections": self.detections,
+            "anomalies": self.anomalies,
+            "detector": self.detector,
+            "table": self.table,
+        }
+
+    def watch(self, handle):
+        if not any(ref() is handle for ref in self.watchers):
+            self.watchers.append(weakref.ref(handle))
+
+    def unwatch(self, handle):
+        self.watchers = [ref for ref in self.watchers if ref() is not handle]
+
+    @property
+    def watched(self):
+        """Whether a session still holds a dataset of the stream."""
+        return any(ref() is not None and ref().alive for ref in self.watchers)
+
+
+class AlertScheduler:
+    """
+    A class that keeps the alerts of the loaded datasets up to date in the background.
+    Each event stream gets a daemon thread that wakes up every `interval` seconds (or as soon as
+    a newer dataset of the stream is tracked) and evaluates the rows that arrived since the last
+    evaluation: alert rules, scan and brute-force detectors and the online activity detector.
+    Results are kept in memory per stream with a version counter, so pages only read them.
+    A stream holds its latest dataset while a session tracking it still holds one of its datasets:
+    it is stopped as soon as the last of them is untracked or released.
+    """
+
+    def __init__(self, interval=ALERT_INTERVAL, idle_timeout=ALERT_IDLE_TIMEOUT):
+        self.interval = interval
+        self.idle_timeout = idle_timeout
+        self._lock = threading.Lock()
+        self._streams = {}
+
+    def track(self, handle):
+        """
+        Register a session handle on a dataset of a stream and start or wake the stream thread.
+        The dataset becomes the one evaluated when it was appended to the current one; an older
+        dataset of the stream (another session still on a parent) only adds a watcher.
+        Return the stream key, or None when the dataset has no datetime column.
+        """
+        time_col = find_time_column(handle.df)
+        if time_col is None or handle.df.schema[time_col] != pl.Datetime:
+            return None
+        key = stream_key(handle, time_col)
+        with self._lock:
+            stream = self._streams.get(key)
+            if stream is None:
+                stream = self._streams[key] = AlertStream(key, time_col)
+            stream.last_seen = time.monotonic()
+            stream.watch(handle)
+            newer = stream.handle is None or stream.handle.key in {
+                ancestor for ancestor, _ in handle.ancestors()
+            }
+            if newer:
+                # The scheduler holds its own reference, released when a newer dataset arrives
+                own = get_dataset_store().get(handle.key)
+                if own is None:
+                    return None
+                if stream.handle is not None:
+                    stream.handle.release()
+                stream.handle = own
+                stream.wake.set()
+            if stream.thread is None or not stream.thread.is_alive():
+                stream.thread = threading.Thread(
+                    target=self._run, args=(stream,), daemon=True
+                )
+                stream.thread.start()
+        return key
+
+    def untrack(self, handle):
+        """
+        Forget a session handle, e.g. when its session switches datasets. A stream no session
+        holds anymore is stopped right away, which releases its dataset.
+        """
+        with self._lock:
+            for stream in list(self._streams.values()):
+                stream.unwatch(handle)
+                if not stream.watched:
+                    del self._streams[stream.key]
+                    self._close(stream)
+
+    def snapshot(self, key):
+        """Return the latest results of a stream (see AlertStream.snapshot), or None."""
+        with self._lock:
+            stream = self._streams.get(key)
+            if stream is None:
+                return None
+            stream.last_seen = time.monotonic()
+            return stream.snapshot()
+
+    def refresh(self, key):
+        """Evaluate the new data of a stream now, in the calling thread."""
+        with self._lock:
+            stream = self._streams.get(key)
+        if stream is not None:
+            self._evaluate(stream)
+
+    def reset_detector(self, key):
+        """Forget the online detector state of a stream: its whole history is scored again."""
+        with self._lock:
+            stream = self._streams.get(key)
+        if stream is None:
+            reset_detector(key)
+            return
+        with stream.evaluating:
+            reset_detector(key)
+            with self._lock:
+                stream.anomalies = pl.DataFrame(schema=ANOMALY_SCHEMA)
+                stream.detector = None
+                # Evaluated again on the next wake up
+                stream.evaluated_key = None
+                stream.evaluated_keys = frozenset()
+        stream.wake.set()
+
+    def _run(self, stream):
+        while True:
+            stream.wake.wait(self.interval)
+            stream.wake.clear()
+            with self._lock:
+                if self._streams.get(stream.key) is not stream:
+                    return
+                if (
+                    not stream.watched
+                    or time.monotonic() - stream.last_seen > self.idle_timeout
+                ):
+                    del self._streams[stream.key]
+                    self._close(stream)
+                    return
+            self._evaluate(stream)
+
+    @staticmethod
+    def _close(stream):
+        if stream.handle is not None:
+            stream.handle.release()
+            stream.handle = None
+        stream.wake.set()
+
+    def _evaluate(self, stream):
+        # Held during the whole evaluation: refresh() and the thread never evaluate twice at once
+        with stream.evaluating:
+            handle = stream.handle
+            if handle is None or handle.key == stream.evaluated_key:
+                return
+            df, time_col = handle.df, stream.time_col
+            last = df[time_col].max()
+            if last is None:
+                return
+            try:
+                start = since = None
+                recent = nearby = df
+                if stream.evaluated_until is not None:
+                    # Only the rows after the last complete RESCAN_EVERY bucket are evaluated again,
+                    # and the sliding windows that may contain them
+                    start, since = pl.select(
+                        start=pl.lit(stream.evaluated_until).dt.truncate(RESCAN_EVERY),
+                        since=pl.min_horizontal(
+                            pl.lit(stream.evaluated_until)
+                            .dt.truncate(RESCAN_EVERY)
+                            .dt.offset_by(f"-{window}")
+                            for window in DETECTION_LOOKBACK
+                        ),
+                    ).row(0)
+                    recent = time_slice(df, start, last, column=time_col)
+                    nearby = time_slice(df, since, last, column=time_col)
+
+                rules = get_alert_rule_engine().evaluate(recent, time_col)
+                windows = detection_windows(
+                    nearby, time_col, find_message_column(df), since=since
+                )
+                # The online detector keeps its own state and only scores the new buckets
+                detector = load_detector(stream.key)
+                anomalies = detector.update(df, time_col).filter("is_anomaly")
+                save_detector(stream.key, detector)
+
+                new_alerts = rules.height + anomalies.height
+                if start is not None:
+                    kept_rules = stream.rules.filter(pl.col("window_start") < start)
+                    # Alerts of the re-evaluated range were already reported
+                    new_alerts -= stream.rules.height - kept_rules.height
+                    rules = pl.concat([kept_rules, rules])
+                    windows = pl.concat(
+                        [stream.windows.filter(pl.col("window_start") < since), windows]
+                    )
+                # Windows of the same detector, source and target make one detection, whichever
+                # evaluation found them; only the new ones count as new alerts
+                pairs = ["detector", "source", "target"]
+                new_alerts += (
+                    windows.select(pairs)
+                    .unique()
+                    .join(stream.windows.select(pairs), on=pairs, how="anti")
+                    .height
+                )
+                detections = summarize_windows(windows).collect()
+                # Every anomaly of the stream, including those saved by earlier processes
+                anomalies = detector.anomalies.filter(pl.col("bucket") <= last)
+                table = alert_table(rules, detections, anomalies).head(ALERT_TABLE_ROWS)
+            except (Exception, pl.exceptions.PanicException) as e:
+                # Polars panics derive from BaseException: caught too, so the thread keeps running
+                with self._lock:
+                    stream.error = str(e) or type(e).__name__
+                    stream.version += 1
+                return
+
+            with self._lock:
+                stream.rules = rules
+                stream.windows = windows
+                stream.detections = detections
+                stream.anomalies = anomalies
+                stream.detector = detector.state()
+                stream.table = table
+                stream.new_alerts = max(new_alerts, 0)
+                stream.evaluated_key = handle.key
+                stream.evaluated_keys = frozenset(
+                    [handle.key, *(key for key, _ in handle.ancestors())]
+                )
+                stream.evaluated_until = last
+                stream.evaluated_at = datetime.now()
+                stream.error = None
+                stream.version += 1
+
+
+_scheduler = None
+_scheduler_lock = threading.Lock()
+
+
+def get_alert_scheduler():
+    """Return the AlertScheduler shared by every session of the current process."""
+    global _scheduler
+    with _scheduler_lock:
+        if _scheduler is None:
+            _scheduler = AlertScheduler()
+        return _scheduler
@@ -0,0 +1,127 @@
+import polars as pl
+
+from utils.error_detection import error_types, match_keywords
+
+# Activity anomalies: counts per bucket compared with a rolling mean +/- ANOMALY_SIGMAS std
+ANOMALY_EVERY = "5m"
+ANOMALY_WINDOW = 5
+ANOMALY_SIGMAS = 2
+ERROR_COUNT_EVERY = "1h"
+# Columns searched (case-insensitively) for error keywords
+LEVEL_COLUMNS = [
+    "level",
+    "severity",
+    "log_level",
+    "type",
+    "status",
+    "content",
+    "message",
+]
+TIME_COLUMNS = ["timestamp", "date", "time", "datetime"]
+MESSAGE_COLUMNS = ["message", "content"]
+
+
+def find_level_columns(df):
+    """Return the columns that may hold a log level or an error message."""
+    return [col for col in df.columns if col.lower() in LEVEL_COLUMNS]
+
+
+def find_time_column(df):
+    """Return the first datetime column, else the first column with a usual time name, else None."""
+    datetime_cols = [col for col, dtype in df.schema.items() if dtype == pl.Datetime]
+    if datetime_cols:
+        return datetime_cols[0]
+    return next((col for col in TIME_COLUMNS if col in df.columns), None)
+
+
+def find_message_column(df):
+    """Return the free-text message column (syslog "Content", "message"...), or None."""
+    return next((col for col in df.columns if col.lower() in MESSAGE_COLUMNS), None)
+
+
+def bucket_counts(query, time_col, every, weight_col=None):
+    """
+    Count the rows of a LazyFrame per time bucket of width `every` (or sum weight_col when the
+    rows are already counts), with a zero for every empty bucket between the first and the last.
+    Return a LazyFrame (time_col, count) sorted by time.
+    """
+    count = pl.col(weight_col).sum() if weight_col else pl.len()
+    counts = (
+        query.filter(pl.col(time_col).is_not_null())
+        .group_by(pl.col(time_col).dt.truncate(every))
+        .agg(count.cast(pl.UInt32).alias("count"))
+    )
+    buckets = counts.select(
+        pl.datetime_range(pl.col(time_col).min(), pl.col(time_col).max(), every).alias(
+            time_col
+        )
+    )
+    return (
+        buckets.join(counts, on=time_col, how="left")
+        .with_columns(pl.col("count").fill_null(0))
+        .sort(time_col)
+    )
+
+
+def activity_bands(counts, window=ANOMALY_WINDOW, sigmas=ANOMALY_SIGMAS):
+    """
+    Add the rolling mean and std of the count over `window` buckets, the band
+    mean +/- sigmas * std (clipped at 0) and is_anomaly (count outside the band) to a LazyFrame of counts.
+    """
+    count = pl.col("count").cast(pl.Float64)
+    return (
+        counts.with_columns(
+            count.rolling_mean(window, min_samples=1).alias("moving_avg"),
+            count.rolling_std(window, min_samples=1)
+            .fill_nan(0)
+            .fill_null(0)
+            .alias("std"),
+        )
+        .with_columns(
+            (pl.col("moving_avg") + sigmas * pl.col("std")).alias("upper_bound"),
+            (pl.col("moving_avg") - sigmas * pl.col("std"))
+            .clip(lower_bound=0)
+            .alias("lower_bound"),
+        )
+        .with_columns(
+            (
+                (pl.col("count") > pl.col("upper_bound"))
+                | (pl.col("count") < pl.col("lower_bound"))
+            ).alias("is_anomaly")
+        )
+    )
+
+
+def alerts_plan(df, level_cols, time_col=None, activity=None):
+    """
+    Build the lazy queries of the alerts page on the shared frame df:
+    - "errors": rows whose level columns contain an error keyword, with the match columns,
+    - "error_types": most frequent error types among them,
+    - "error_counts": errors per ERROR_COUNT_EVERY bucket,
+    - "activity": entries per ANOMALY_EVERY bucket with the rolling bands and anomaly flags.
+    `activity` is a LazyFrame (time_col, count) of pre-aggregated counts (e.g. a time pyramid
+    level); when it is None, the rows of df are counted.
+    Queries whose inputs are missing (no level column, no datetime column) are left out.
+    """
+    plan = {}
+    query = df.lazy()
+    has_time = time_col is not None and df.schema[time_col] == pl.Datetime
+    if level_cols:
+        errors = match_keywords(query, level_cols).filter("is_error")
+        plan["errors"] = errors
+        plan["error_types"] = error_types(errors)
+        if has_time:
+            plan["error_counts"] = bucket_counts(errors, time_col, ERROR_COUNT_EVERY)
+    if has_time:
+        if activity is None:
+            counts = bucket_counts(query, time_col, ANOMALY_EVERY)
+        else:
+            counts = bucket_counts(activity, time_col, ANOMALY_EVERY, "count")
+        plan["activity"] = activity_bands(counts)
+    return plan
+
+
+def run_alerts(df, level_cols, time_col=None, activity=None):
+    """Run every query of alerts_plan in a single collect_all, so the scans of df are shared."""
+    plan = alerts_plan(df, level_cols, time_col, activity)
+    return dict(zip(plan, pl.collect_all(plan.values())))
@@ -0,0 +1,351 @@
+import threading
+import time
+import warnings
+from collections import OrderedDict
+
+import numpy as np
+import polars as pl
+from joblib import Parallel, delayed
+from scipy import sparse
+from sklearn.cluster import KMeans, MiniBatchKMeans
+from sklearn.decomposition import TruncatedSVD
+from sklearn.metrics import davies_bouldin_score, silhouette_score
+
+from utils import disk_cache
+
+FEATURE_COLUMNS = ["portdst", "protocole", "rule", "action"]
+# Columns with more distinct values than this are feature-hashed instead of one-hot encoded
+MAX_ONE_HOT_CATEGORIES = 1000
+HASH_FEATURES = 1024
+NULL_CATEGORY = "<null>"
+# Scalable mode: rows used to fit the model, and rows projected/assigned per batch
+SAMPLE_SIZE = 100_000
+PREDICT_BATCH_SIZE = 100_000
+# Automatic choice of k: candidates, rows they are fitted on, and time allowed for the search (seconds)
+K_CANDIDATES = range(2, 11)
+SELECTION_SAMPLE_SIZE = 20_000
+SILHOUETTE_SAMPLE_SIZE = 5_000
+SELECTION_TIME_BUDGET = 30
+# Bytes of per-row results (coordinates, labels) of the fitted clusterings kept in memory;
+# the least recently used ones are dropped beyond it and reloaded from disk when needed
+CLUSTERING_CACHE_BYTES = 256 * 2**20
+# Most frequent values shown per feature and cluster in the profiles
+PROFILE_TOP_VALUES = 20
+
+
+class SparseFeatureEncoder:
+    """
+    A class that encodes categorical polars columns into a sparse CSR matrix.
+    Low-cardinality columns are one-hot encoded, high-cardinality ones are hashed into a fixed
+    number of buckets, so memory grows with the number of non-zeros (one per row and column).
+    """
+
+    def __init__(self, max_categories=MAX_ONE_HOT_CATEGORIES, n_hash=HASH_FEATURES):
+        self.max_categories = max_categories
+        self.n_hash = n_hash
+        self.columns = []
+        self.categories = {}
+        self.feature_names = []
+
+    def _values(self, df, col):
+        return df[col].cast(pl.Utf8).fill_null(NULL_CATEGORY)
+
+    def fit(self, df, columns=FEATURE_COLUMNS):
+        """Learn the categories of the one-hot columns and decide which columns are hashed."""
+        self.columns = [col for col in columns if col in df.columns]
+        self.categories = {}
+        self.feature_names = []
+        for col in self.columns:
+            distinct = self._values(df, col).unique().sort()
+            if distinct.len() <= self.max_categories:
+                self.categories[col] = distinct
+                self.feature_names += [f"{col}_{value}" for value in distinct]
+            else:
+                self.feature_names += [f"{col}_hash{i}" for i in range(self.n_hash)]
+        return self
+
+    def transform(self, df):
+        """Encode df into a CSR matrix; categories unseen during fit are left empty."""
+        blocks = []
+        for col in self.columns:
+            values = self._values(df, col)
+            if col in self.categories:
+                width = self.categories[col].len()
+                codes = values.replace_strict(
+                    self.categories[col],
+                    pl.int_range(width, eager=True),
+                    default=None,
+                    return_dtype=pl.Int64,
+                )
+            else:
+                width = self.n_hash
+                codes = (values.hash(seed=42) % self.n_hash).cast(pl.Int64)
+            blocks.append(self._one_hot_block(codes, width))
+        return sparse.hstack(blocks, format="csr")
+
+    def fit_transform(self, df, columns=FEATURE_COLUMNS):
+        return self.fit(df, columns).transform(df)
+
+    @staticmethod
+    def _one_hot_block(codes, width):
+        """Build a CSR block with a single 1 per row at column codes[row] (no entry for nulls)."""
+        known = codes.is_not_null().to_numpy()
+        rows = np.flatnonzero(known)
+        cols = codes.drop_nulls().to_numpy()
+        data = np.ones(len(rows), dtype=np.float32)
+        return sparse.csr_matrix(
+            (data, (rows, cols)), shape=(codes.len(), width), dtype=np.float32
+        )
+
+
+def stratified_sample(strata, sample_size, seed=42):
+    """
+    Return the row indices of a sample of about sample_size rows, drawn proportionally
+    from each value of `strata` (a polars Series) so that small strata are kept.
+    """
+    n_rows = strata.len()
+    if sample_size >= n_rows:
+        return np.arange(n_rows)
+    fraction = sample_size / n_rows
+    return (
+        pl.DataFrame({"stratum": strata})
+        .with_row_index("row")
+        .filter(
+            pl.int_range(pl.len()).shuffle(seed=seed).over("stratum")
+            < (pl.len().over("stratum") * fraction).ceil()
+        )["row"]
+        .sort()
+        .to_numpy()
+    )
+
+
+def fit_clusters(
+    X,
+    n_clusters,
+    mode="full",
+    sample_size=SAMPLE_SIZE,
+    strata=None,
+    batch_size=PREDICT_BATCH_SIZE,
+    progress=None,
+):
+    """
+    Reduce the sparse matrix X to 2 components and cluster it.
+    "full" fits TruncatedSVD and KMeans on every row. "scalable" fits them (MiniBatchKMeans) on a
+    stratified sample, then projects and assigns the rows batch by batch, so only one batch is
+    ever densified. `progress(fraction)` is called after each batch.
+    Return (reducer, model, coordinates, labels).
+    """
+    if mode == "full":
+        reducer = TruncatedSVD(n_components=2, random_state=42)
+        coordinates = reducer.fit_transform(X)
+        model = KMeans(n_clusters=n_clusters, random_state=42)
+        labels = model.fit_predict(coordinates)
+        if progress is not None:
+            progress(1.0)
+        return reducer, model, coordinates, labels
+
+    if strata is None:
+        sample = np.random.default_rng(42).permutation(X.shape[0])[:sample_size]
+    else:
+        sample = stratified_sample(strata, sample_size)
+    reducer = TruncatedSVD(n_components=2, random_state=42).fit(X[sample])
+    model = MiniBatchKMeans(
+        n_clusters=n_clusters, batch_size=4096, n_init=3, random_state=42
+    ).fit(reducer.transform(X[sample]))
+    coordinates, labels = assign_clusters(X, reducer, model, batch_size, progress)
+    return reducer, model, coordinates, labels
+
+
+def _score_k(coordinates, k):
+    """Fit KMeans with k clusters on the (sampled, reduced) coordinates and return its quality scores."""
+    model = KMeans(n_clusters=k, random_state=42).fit(coordinates)
+    return {
+        "k": k,
+        "silhouette": silhouette_score(
+            coordinates,
+            model.labels_,
+            sample_size=min(SILHOUETTE_SAMPLE_SIZE, len(coordinates)),
+            random_state=42,
+        ),
+        "davies_bouldin": davies_bouldin_score(coordinates, model.labels_),
+        "inertia": model.inertia_,
+    }
+
+
+def select_n_clusters(
+    X,
+    k_values=K_CANDIDATES,
+    sample_size=SELECTION_SAMPLE_SIZE,
+    strata=None,
+    time_budget=SELECTION_TIME_BUDGET,
+    n_jobs=-1,
+):
+    """
+    Choose the number of clusters on a bounded sample of the sparse matrix X.
+    The candidates are fitted in parallel (one process per core), dispatched by increasing k;
+    results are collected as they complete and the search stops at the first one arriving after
+    time_budget seconds (the candidates still pending are cancelled), so it stays bounded on
+    large datasets whatever the number of cores. The k with the best silhouette wins (Davies-Bouldin breaks ties).
+    Return (k, scores), scores being a polars DataFrame with one row per evaluated k.
+    """
+    if strata is None:
+        sample = np.random.default_rng(42).permutation(X.shape[0])[:sample_size]
+    else:
+        sample = stratified_sample(strata, sample_size)
+    coordinates = TruncatedSVD(n_components=2, random_state=42).fit_transform(X[sample])
+    # A candidate needs at least as many distinct points as clusters
+    n_distinct = len(np.unique(coordinates, axis=0))
+    k_values = [k for k in k_values if k < n_distinct]
+    if not k_values:
+        return 1, pl.DataFrame(
+            schema={
+                "k": pl.Int64,
+                "silhouette": pl.Float64,
+                "davies_bouldin": pl.Float64,
+                "inertia": pl.Float64,
+            }
+        )
+
+    started = time.monotonic()
+    results = []
+    candidates = Parallel(n_jobs=n_jobs, return_as="generator_unordered")(
+        delayed(_score_k)(coordinates, k) for k in k_values
+    )
+    try:
+        for result in candidates:
+            results.append(result)
+            if time.monotonic() - started > time_budget:
+                break
+    finally:
+        # Closing the generator cancels the candidates still pending (joblib warns about it)
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore", UserWarning)
+            candidates.close()
+
+    scores = pl.DataFrame(results).sort("k")
+    best = scores.sort(["silhouette", "davies_bouldin"], descending=[True, False]).row(
+        0, named=True
+    )
+    return best["k"], scores
+
+
+def assign_clusters(X, reducer, model, batch_size=PREDICT_BATCH_SIZE, progress=None):
+    """Project and assign the rows of X to the fitted clusters, batch by batch."""
+    n_rows = X.shape[0]
+    coordinates = np.empty((n_rows, 2), dtype=X.dtype)
+    labels = np.empty(n_rows, dtype=np.int32)
+    for start in range(0, n_rows, batch_size):
+        end = min(start + batch_size, n_rows)
+        coordinates[start:end] = reducer.transform(X[start:end])
+        labels[start:end] = model.predict(coordinates[start:end])
+        if progress is not None:
+            progress(end / n_rows)
+    return coordinates, labels
+
+
+def cluster_profiles(df, labels, columns=FEATURE_COLUMNS, top_n=PROFILE_TOP_VALUES):
+    """
+    Count the values of every feature column in every cluster in a single grouped pass:
+    the columns are unpivoted to (feature, value) pairs and grouped with the cluster labels.
+    Return a polars DataFrame (feature, cluster, value, frequency) holding the top_n values
+    of each feature in each cluster, most frequent first.
+    """
+    return (
+        df.lazy()
+        .select(
+            pl.lit(pl.Series("cluster", labels)),
+            *[pl.col(col).cast(pl.Utf8).fill_null(NULL_CATEGORY) for col in columns],
+        )
+        .unpivot(
+            on=columns, index="cluster", variable_name="feature", value_name="value"
+        )
+        .group_by(["feature", "cluster", "value"])
+        .agg(pl.len().alias("frequency"))
+        .filter(
+            pl.col("frequency")
+            .rank("ordinal", descending=True)
+            .over(["feature", "cluster"])
+            <= top_n
+        )
+        .sort(["feature", "cluster", "frequency"], descending=[False, False, True])
+        .collect()
+    )
+
+
+_clusterings = OrderedDict()
+_clusterings_lock = threading.Lock()
+
+
+def clustering_key(fingerprint, n_clusters, mode, sample_size, columns=FEATURE_COLUMNS):
+    """Identify a clustering by its dataset and every hyperparameter that shapes the result."""
+    if mode != "scalable":
+        sample_size = None
+    # The encoder hashes high-cardinality columns with polars: hashes are only stable within a version
+    return disk_cache.cache_key(
+        fingerprint, n_clusters, mode, sample_size, tuple(columns), pl.__version__
+    )
+
+
+def _clustering_bytes(clustering):
+    return clustering["coordinates"].nbytes + clustering["labels"].nbytes
+
+
+def _remember(key, clustering):
+    with _clusterings_lock:
+        _clusterings[key] = clustering
+        _clusterings.move_to_end(key)
+        total = sum(_clustering_bytes(value) for value in _clusterings.values())
+        # The clustering just used is always kept, even above the budget
+        while len(_clusterings) > 1 and total > CLUSTERING_CACHE_BYTES:
+            _, evicted = _clusterings.popitem(last=False)
+            total -= _clustering_bytes(evicted)
+
+
+def _lookup(key):
+    with _clusterings_lock:
+        if key in _clusterings:
+            _clusterings.move_to_end(key)
+            return _clusterings[key]
+    clustering = disk_cache.load("clustering", key)
+    if clustering is not None:
+        _remember(key, clustering)
+    return clustering
+
+
+def save_clustering(fingerprint, params, clustering):
+    """
+    Keep a fitted clustering in memory and on disk. `params` holds the keyword arguments of
+    clustering_key, `clustering` the encoder, reducer, model, coordinates and labels
+    (and the k selection scores when k was chosen automatically).
+    """
+    key = clustering_key(fingerprint, **params)
+    _remember(key, clustering)
+    disk_cache.save("clustering", key, clustering)
+
+
+def load_clustering(handle, params, progress=None):
+    """
+    Return the clustering saved for the dataset of handle with these params, or None.
+    When only a dataset it was appended to has been clustered, the appended rows are encoded and
+    assigned to the existing clusters with predict instead of refitting everything.
+    """
+    clustering = _lookup(clustering_key(handle.key, **params))
+    if clustering is not None:
+        return clustering
+
+    for ancestor, rows in handle.ancestors():
+        base = _lookup(clustering_key(ancestor, **params))
+        if base is None:
+            continue
+        X = base["encoder"].transform(handle.df.slice(rows))
+        coordinates, labels = assign_clusters(
+            X, base["reducer"], base["model"], progress=progress
+        )
+        clustering = dict(
+            base,
+            coordinates=np.concatenate([base["coordinates"], coordinates]),
+            labels=np.concatenate([base["labels"], labels]),
+        )
+        save_clustering(handle.key, params, clustering)
+        return clustering
+    return None
@@ -0,0 +1,35 @@
+import polars as pl
+
+CUBE_DIMENSIONS = ["ipsrc", "ipdst", "portdst", "protocole", "action"]
+
+
+def build_traffic_cube(df):
+    """
+    Materialize the number of events for every combination of the firewall dimensions
+    (ipsrc, ipdst, portdst, protocole, action).
+    Each dimension is dictionary-encoded, so the cube grows with distinct combinations, not with events.
+    Time is not a dimension: the time series are served by the time pyramid (utils/timeseries.py).
+    """
+    dimensions = [col for col in CUBE_DIMENSIONS if col in df.columns]
+    keys = [pl.col(col).cast(pl.Utf8).cast(pl.Categorical) for col in dimensions]
+
+    return (
+        df.lazy().group_by(keys).agg(pl.len().cast(pl.UInt32).alias("count")).collect()
+    )
+
+
+def rollup(cube, dimensions, where=None):
+    """
+    Sum the cube counts over every dimension not listed in `dimensions`.
+    `where` is an optional polars expression evaluated on the cube before the roll-up.
+    Categorical dimensions are decoded back to strings in the (small) result.
+    """
+    query = cube.lazy()
+    if where is not None:
+        query = query.filter(where)
+    return (
+        query.group_by(dimensions)
+        .agg(pl.col("count").sum())
+        .with_columns(pl.col(pl.Categorical).cast(pl.Utf8))
+        .collect()
+    )
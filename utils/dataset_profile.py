@@ -0,0 +1,294 @@
+import math
+
+import polars as pl
+
+from utils import disk_cache
+from utils.sketches import APPROX_ROW_THRESHOLD, HeavyHitters, HyperLogLog
+
+# Most frequent values kept per non-numeric column
+PROFILE_TOP_VALUES = 20
+HISTOGRAM_BINS = 20
+QUANTILES = {"25%": 0.25, "50%": 0.5, "75%": 0.75}
+# Values kept per numeric column to estimate quartiles and histograms of merged profiles
+QUANTILE_SAMPLE_SIZE = 10_000
+
+
+def column_kind(dtype):
+    """Classify a dtype as "numeric", "datetime" or "categorical" (everything else)."""
+    if dtype.is_numeric():
+        return "numeric"
+    if dtype.is_temporal():
+        return "datetime"
+    return "categorical"
+
+
+def _column_exprs(name, dtype, bins, approximate):
+    """Return the aggregations profiling one column, each aliased "<column>\\x00<statistic>"."""
+    col = pl.col(name)
+    stats = {"nulls": col.null_count()}
+    kind = column_kind(dtype)
+    if kind == "numeric" and not approximate:
+        stats["distinct"] = col.n_unique()
+    if kind in ("numeric", "datetime"):
+        stats["min"] = col.min()
+        stats["max"] = col.max()
+    if kind == "numeric":
+        values = col.cast(pl.Float64)
+        stats["mean"] = values.mean()
+        stats["std"] = values.std()
+        for label, quantile in QUANTILES.items():
+            stats[label] = values.quantile(quantile, "nearest")
+        stats["histogram"] = values.hist(
+            bin_count=bins, include_breakpoint=True
+        ).implode()
+    elif kind == "datetime" and dtype in (pl.Date, pl.Datetime):
+        # Distinct values are kept (a few hundred at most) so profiles can be merged exactly
+        stats["dates"] = col.dt.date().unique().drop_nulls().implode()
+        stats["months"] = col.dt.month().unique().drop_nulls().implode()
+    return [expr.alias(f"{name}\x00{stat}") for stat, expr in stats.items()]
+
+
+def _numeric_sample(series, size=QUANTILE_SAMPLE_SIZE):
+    values = series.drop_nulls().cast(pl.Float64)
+    return values.sample(min(size, len(values)), seed=0)
+
+
+def build_profile(
+    df, top_values=PROFILE_TOP_VALUES, bins=HISTOGRAM_BINS, approximate=None
+):
+    """
+    Compute every statistic of the statistics page in a single query over df:
+    row count and size, then per column null and distinct counts, min/max, mean, std and
+    quartiles plus a histogram for numeric columns, distinct dates and months for datetime
+    columns, and the top_values most frequent values of the other columns.
+    With `approximate` (by default when df has more than APPROX_ROW_THRESHOLD rows), distinct
+    counts come from HyperLogLog sketches and top values from heavy-hitters summaries;
+    "distinct_error" is then the relative standard error of the distinct count and "top" has an
+    upper_bound column.
+    The profile also keeps mergeable partial state ("sketches": a HyperLogLog and a heavy-hitters
+    summary or a sample of values per column), so merge_profiles can fold in appended batches.
+    Return a dict {"rows", "size_bytes", "approximate", "batches", "columns": {name: {"dtype", "kind",
+    statistic: value}}, "sketches"}, where "top" and "histogram" are DataFrames.
+    """
+    if approximate is None:
+        approximate = df.height > APPROX_ROW_THRESHOLD
+    schema = df.schema
+    exprs = [
+        expr
+        for name, dtype in schema.items()
+        for expr in _column_exprs(name, dtype, bins, approximate)
+    ]
+    sketched = [name for name, dtype in schema.items() if not dtype.is_nested()]
+    # Exact value counts of the non-numeric columns give their distinct count, top values and summary
+    counted = (
+        []
+        if approximate
+        else [name for name in sketched if column_kind(schema[name]) != "numeric"]
+    )
+    queries = [df.lazy().select(exprs)] if exprs else []
+    queries += [
+        HyperLogLog.registers_query(df.lazy(), name, schema[name]) for name in sketched
+    ]
+    queries += [
+        df.lazy().group_by(pl.col(name).alias("value")).agg(pl.len().alias("count"))
+        for name in counted
+    ]
+    # One collect_all: the statistics, the sketch registers and the counts share the scans of df
+    results = pl.collect_all(queries)
+    row = results[0].row(0, named=True) if exprs else {}
+    registers = dict(zip(sketched, results[1 : 1 + len(sketched)]))
+    counts = dict(zip(counted, results[1 + len(sketched) :]))
+
+    columns = {
+        name: {"dtype": str(dtype), "kind": column_kind(dtype)}
+        for name, dtype in schema.items()
+    }
+    sketches = {name: {} for name in schema}
+    for alias, value in row.items():
+        name, stat = alias.split("\x00")
+        if stat == "histogram":
+            value = pl.DataFrame(value)
+        elif stat in ("dates", "months"):
+            sketches[name][stat] = pl.Series(
+                stat, value, dtype=pl.Int64 if stat == "months" else pl.Date
+            )
+            value = len(value)
+        columns[name][stat] = value
+
+    for name in sketched:
+        sketches[name]["distinct"] = HyperLogLog.from_registers(registers[name])
+        if column_kind(schema[name]) == "numeric":
+            sketches[name]["sample"] = _numeric_sample(df[name])
+        elif name in counts:
+            value_counts = counts[name]
+            columns[name]["distinct"] = value_counts.height
+            columns[name]["top"] = (
+                value_counts.sort("count", descending=True)
+                .head(top_values)
+                .rename({"value": name})
+            )
+            sketches[name]["top"] = HeavyHitters.from_counts(value_counts)
+        else:
+            sketches[name]["top"] = HeavyHitters.from_series(df[name])
+        if approximate:
+            columns[name].update(sketch_stats(name, sketches[name], top_values))
+    return {
+        "rows": df.height,
+        "size_bytes": df.estimated_size(),
+        "approximate": approximate,
+        "batches": 1,
+        "columns": columns,
+        "sketches": sketches,
+    }
+
+
+def sketch_stats(name, sketch, top_values=PROFILE_TOP_VALUES):
+    """Return the approximate statistics of a column read from its sketches."""
+    stats = {
+        "distinct": sketch["distinct"].estimate(),
+        "distinct_error": sketch["distinct"].relative_error,
+    }
+    if "top" in sketch:
+        stats["top"] = sketch["top"].top(top_values).rename({"value": name})
+    return stats
+
+
+def _merge_samples(sample, rows, other, other_rows, size=QUANTILE_SAMPLE_SIZE):
+    """Merge two uniform samples of populations of rows and other_rows values into one."""
+    if not rows or not other_rows:
+        return sample if rows else other
+    total = min(size, len(sample) + len(other))
+    taken = min(round(total * rows / (rows + other_rows)), len(sample))
+    taken = max(taken, total - len(other))
+    return pl.concat(
+        [sample.sample(taken, seed=0), other.sample(total - taken, seed=0)]
+    )
+
+
+def _merge_moments(stats, rows, other, other_rows):
+    """Combine means and sample standard deviations of two batches (Chan et al.)."""
+    if not rows or not other_rows:
+        return (stats if rows else other)["mean"], (stats if rows else other)["std"]
+    total = rows + other_rows
+    delta = other["mean"] - stats["mean"]
+    m2 = (
+        (stats["std"] or 0.0) ** 2 * (rows - 1)
+        + (other["std"] or 0.0) ** 2 * (other_rows - 1)
+        + delta**2 * rows * other_rows / total
+    )
+    mean = stats["mean"] + delta * other_rows / total
+    return mean, math.sqrt(m2 / (total - 1))
+
+
+def _bound(values, pick):
+    values = [value for value in values if value is not None]
+    return pick(values) if values else None
+
+
+def merge_profiles(profile, batch, top_values=PROFILE_TOP_VALUES, bins=HISTOGRAM_BINS):
+    """
+    Fold the profile of a batch of appended rows into the profile of the rows before them, without
+    reading either batch again: counts, nulls and min/max add up exactly, means and standard
+    deviations are combined exactly, distinct dates and months are unions, distinct counts and top
+    values come from the merged sketches and quartiles and histograms from the merged samples.
+    The merged profile is therefore approximate.
+    """
+    columns, sketches = {}, {}
+    for name, stats in profile["columns"].items():
+        other = batch["columns"].get(name)
+        if other is None or other["dtype"] != stats["dtype"]:
+            # Columns added or retyped by the batch: nothing to merge, the batch is rebuilt
+            return None
+        merged = dict(stats, nulls=stats["nulls"] + other["nulls"])
+        sketch = {}
+        base_sketch, other_sketch = profile["sketches"][name], batch["sketches"][name]
+        if "min" in stats:
+            merged["min"] = _bound([stats["min"], other["min"]], min)
+            merged["max"] = _bound([stats["max"], other["max"]], max)
+        if "dates" in base_sketch:
+            for stat in ("dates", "months"):
+                sketch[stat] = (
+                    pl.concat([base_sketch[stat], other_sketch[stat]]).unique().sort()
+                )
+                merged[stat] = len(sketch[stat])
+        if "distinct" in base_sketch:
+            sketch["distinct"] = HyperLogLog(base_sketch["distinct"].precision)
+            sketch["distinct"].merge(base_sketch["distinct"]).merge(
+                other_sketch["distinct"]
+            )
+        if "top" in base_sketch:
+            sketch["top"] = HeavyHitters(base_sketch["top"].capacity)
+            sketch["top"].merge(base_sketch["top"]).merge(other_sketch["top"])
+        if "sample" in base_sketch:
+            rows = profile["rows"] - stats["nulls"]
+            other_rows = batch["rows"] - other["nulls"]
+            merged["mean"], merged["std"] = _merge_moments(
+                stats, rows, other, other_rows
+            )
+            sketch["sample"] = _merge_samples(
+                base_sketch["sample"], rows, other_sketch["sample"], other_rows
+            )
+            estimates = (
+                sketch["sample"]
+                .to_frame("value")
+                .select(
+                    *[
+                        pl.col("value").quantile(quantile, "nearest").alias(label)
+                        for label, quantile in QUANTILES.items()
+                    ],
+                    pl.col("value")
+                    .hist(bin_count=bins, include_breakpoint=True)
+                    .implode()
+                    .alias("histogram"),
+                )
+            )
+            merged.update(estimates.select(QUANTILES).row(0, named=True))
+            # Sample counts scaled to the rows they stand for
+            scale = (rows + other_rows) / max(len(sketch["sample"]), 1)
+            merged["histogram"] = (
+                estimates["histogram"][0]
+                .struct.unnest()
+                .with_columns((pl.col("count") * scale).round().cast(pl.Int64))
+            )
+        if sketch.get("distinct") is not None:
+            merged.update(sketch_stats(name, sketch, top_values))
+        columns[name] = merged
+        sketches[name] = sketch
+
+    return {
+        "rows": profile["rows"] + batch["rows"],
+        "size_bytes": profile["size_bytes"] + batch["size_bytes"],
+        "approximate": True,
+        "batches": profile["batches"] + batch["batches"],
+        "columns": columns,
+        "sketches": sketches,
+    }
+
+
+def profile_key(fingerprint, top_values=PROFILE_TOP_VALUES, bins=HISTOGRAM_BINS):
+    # Sketches hash values with polars: they are only mergeable within one polars version
+    return disk_cache.cache_key(fingerprint, top_values, bins, pl.__version__)
+
+
+def profile_dataset(handle):
+    """
+    Return the profile of the dataset of handle, saved on disk under its fingerprint.
+    When a dataset it was appended to has a saved profile, only the appended rows are profiled
+    and merged into it, so refreshing after an append costs as much as the new batch.
+    """
+    profile = disk_cache.load("profile", profile_key(handle.key))
+    if profile is not None:
+        return profile
+
+    for ancestor, rows in handle.ancestors():
+        base = disk_cache.load("profile", profile_key(ancestor))
+        if base is None:
+            continue
+        batch = build_profile(handle.df.slice(rows))
+        profile = merge_profiles(base, batch)
+        if profile is not None:
+            break
+    else:
+        profile = build_profile(handle.df)
+    disk_cache.save("profile", profile_key(handle.key), profile)
+    return profile
@@ -0,0 +1,157 @@
+import hashlib
+import threading
+import weakref
+from collections import OrderedDict
+
+
+class DatasetHandle:
+    """
+    Cheap per-session reference to a dataset held by the DatasetStore.
+    The underlying frame is shared: every handle on the same key points to the same Arrow buffers.
+    The reference is released when the handle is released or garbage collected with its session.
+    """
+
+    def __init__(self, store, key, df):
+        self.key = key
+        self.df = df
+        self._store = store
+        self._finalizer = weakref.finalize(self, store._release, key)
+
+    def release(self):
+        """Release the reference held on the dataset (idempotent)."""
+        self._finalizer()
+
+    def derived(self, name, builder):
+        """Return the artifact `name` computed by builder(df), built once per dataset and shared."""
+        return self._store.derived(self.key, name, builder)
+
+    def ancestors(self):
+        """Return the datasets this one was appended to, as (key, row count) from the nearest."""
+        return self._store.ancestors(self.key)
+
+    @property
+    def alive(self):
+        return self._finalizer.alive
+
+
+class DatasetStore:
+    """
+    Process-wide registry of parsed datasets, keyed by content hash.
+    Sessions hold DatasetHandle objects, and reference counts decide when a dataset can be evicted,
+    so memory grows with the number of distinct datasets rather than with the number of users.
+    """
+
+    def __init__(self, max_idle_bytes=0):
+        # Datasets nobody references are kept (LRU) up to this budget, to make re-uploads instant
+        self.max_idle_bytes = max_idle_bytes
+        self._lock = threading.RLock()
+        self._frames = {}
+        self._refcounts = {}
+        self._derived = {}
+        self._idle = OrderedDict()
+        # Append lineage, kept after eviction (it is tiny): key -> (parent key, parent row count)
+        self._parents = {}
+
+    def get(self, key):
+        """Return a new handle on an already stored dataset, or None if the key is unknown."""
+        with self._lock:
+            if key not in self._frames:
+                return None
+            return self._acquire(key)
+
+    def put(self, key, df, parent=None):
+        """
+        Store a dataset (unless an identical one is already stored) and return a handle on it.
+        `parent` is the key of the dataset it was built from by appending rows: its rows are then
+        the first rows of df.
+        """
+        with self._lock:
+            if parent is not None and parent in self._frames:
+                self._parents[key] = (parent, self._frames[parent].height)
+            if key not in self._frames:
+                self._frames[key] = df
+                self._refcounts[key] = 0
+                self._derived[key] = {}
+            return self._acquire(key)
+
+    def derived(self, key, name, builder):
+        """
+        Return an artifact computed from a stored dataset (aggregates, indexes...).
+        It is built on first request, shared by every session and evicted with the dataset.
+        """
+        with self._lock:
+            artifacts = self._derived[key]
+            if name in artifacts:
+                return artifacts[name]
+            df = self._frames[key]
+
+        # Build outside the lock so other sessions are not blocked meanwhile
+        value = builder(df)
+        with self._lock:
+            if key not in self._derived:
+                return value
+            return self._derived[key].setdefault(name, value)
+
+    def ancestors(self, key):
+        """Return the chain of datasets `key` was appended to, as (key, row count) from the nearest."""
+        chain = []
+        with self._lock:
+            while key in self._parents:
+                key, rows = self._parents[key]
+                chain.append((key, rows))
+        return chain
+
+    def stats(self):
+        """Return a summary of the stored datasets: key, reference count and estimated size."""
+        with self._lock:
+            return [
+                {
+                    "key": key,
+                    "refcount": self._refcounts[key],
+                    "size_bytes": df.estimated_size(),
+                }
+                for key, df in self._frames.items()
+            ]
+
+    def _acquire(self, key):
+        self._refcounts[key] += 1
+        self._idle.pop(key, None)
+        return DatasetHandle(self, key, self._frames[key])
+
+    def _release(self, key):
+        with self._lock:
+            if key not in self._refcounts:
+                return
+            self._refcounts[key] -= 1
+            if self._refcounts[key] <= 0:
+                self._idle[key] = self._frames[key].estimated_size()
+                self._evict_idle()
+
+    def _evict_idle(self):
+        idle_bytes = sum(self._idle.values())
+        while self._idle and idle_bytes > self.max_idle_bytes:
+            key, size = self._idle.popitem(last=False)
+            idle_bytes -= size
+            del self._frames[key]
+            del self._refcounts[key]
+            del self._derived[key]
+
+
+def dataset_fingerprint(file, *options, chunk_size=1 << 24):
+    """Hash the content of an uploaded file together with the parsing options that shape the dataset."""
+    digest = hashlib.blake2b(digest_size=16)
+    for option in options:
+        digest.update(repr(option).encode())
+    file.seek(0)
+    for chunk in iter(lambda: file.read(chunk_size), b""):
+        digest.update(chunk)
+    file.seek(0)
+    return digest.hexdigest()
+
+
+_store = DatasetStore()
+
+
+def get_dataset_store():
+    """Return the DatasetStore shared by every session of the current process."""
+    return _store
@@ -0,0 +1,286 @@
+import polars as pl
+
+# Sliding windows: each window covers WINDOW and a new one starts every STEP
+SCAN_WINDOW = "5m"
+SCAN_STEP = "1m"
+MIN_SCANNED_PORTS = 50
+MIN_SCANNED_HOSTS = 20
+BRUTE_FORCE_WINDOW = "5m"
+BRUTE_FORCE_STEP = "1m"
+MIN_FAILURES = 20
+FAILURE_PATTERN = r"(?i)failed password|authentication failure|invalid user"
+SOURCE_IP_PATTERN = r"(?:from|rhost=)\s*(\d{1,3}(?:\.\d{1,3}){3})"
+# Flagged sliding windows: target is the host (vertical scans), port (horizontal scans) or "ssh"
+WINDOW_SCHEMA = {
+    "detector": pl.Utf8,
+    "source": pl.Utf8,
+    "target": pl.Utf8,
+    "window_start": pl.Datetime("us"),
+    "value": pl.UInt32,
+}
+# Label of the target of each detector in the alerts, from the target and the peak value
+TARGET_LABELS = {
+    "Vertical port scan": lambda target, peak: pl.format("{} ({} ports)", target, peak),
+    "Horizontal port scan": lambda target, peak: pl.format(
+        "port {} ({} hosts)", target, peak
+    ),
+    "SSH brute force": lambda target, peak: pl.format("{} failures", peak),
+}
+DETECTION_SCHEMA = {
+    "detector": pl.Utf8,
+    "source": pl.Utf8,
+    "target": pl.Utf8,
+    "first_window": pl.Datetime("us"),
+    "last_window": pl.Datetime("us"),
+    "windows": pl.UInt32,
+    "peak": pl.UInt32,
+}
+
+
+def _candidate_keys(events, time_col, keys, bound, window, threshold):
+    """
+    Return the keys that may reach threshold in some sliding window, as a LazyFrame.
+    A window of width `window` overlaps at most two consecutive tumbling buckets of the same width,
+    so when `bound` (an additive upper bound of the windowed value, e.g. a row count for a distinct
+    count) reaches threshold in a window, it reaches half of it in one of these buckets.
+    """
+    return (
+        events.group_by(*keys, pl.col(time_col).dt.truncate(window).alias("bucket"))
+        .agg(bound.alias("bound"))
+        .filter(pl.col("bound") * 2 >= threshold)
+        .select(keys)
+        .unique()
+    )
+
+
+def _sliding_windows(
+    events, time_col, keys, value, bound, window, step, threshold, since=None
+):
+    """
+    Aggregate value (an expression) per keys over sliding windows of width `window` starting every
+    `step`, from `since` (by default the first event, truncated to the step), and return the
+    windows reaching threshold: keys, window start (under time_col) and value.
+    Only the candidate keys (see _candidate_keys) go through the sliding windows, which keeps
+    the cost close to one grouped pass when alerts are rare.
+    """
+    candidates = _candidate_keys(events, time_col, keys, bound, window, threshold)
+    time = pl.col(time_col)
+    first = pl.lit(since) if since is not None else time.min().dt.truncate(step)
+    return (
+        events.with_columns(
+            first.cast(events.collect_schema()[time_col]).alias("since")
+        )
+        .join(candidates, on=keys, how="semi")
+        # Each event is repeated in every window containing it: the starts on the step grid
+        # after time - window, up to time, and not before `since`
+        # (a plain group_by then aggregates the windows, even of a single row)
+        .with_columns(
+            pl.datetime_ranges(
+                pl.max_horizontal(
+                    time.dt.offset_by(f"-{window}")
+                    .dt.truncate(step)
+                    .dt.offset_by(step),
+                    pl.col("since"),
+                ),
+                time,
+                interval=step,
+            ).alias(time_col)
+        )
+        .explode(time_col)
+        .drop_nulls(time_col)
+        .group_by(*keys, time_col)
+        .agg(value.alias("value"))
+        .filter(pl.col("value") >= threshold)
+    )
+
+
+def _detection_windows(windows, time_col, detector, source, target):
+    """Put the windows of one detector in the shape of WINDOW_SCHEMA."""
+    return windows.select(
+        pl.lit(detector).alias("detector"),
+        pl.col(source).cast(pl.Utf8).alias("source"),
+        target.cast(pl.Utf8).alias("target"),
+        pl.col(time_col).cast(pl.Datetime("us")).alias("window_start"),
+        pl.col("value").cast(pl.UInt32),
+    )
+
+
+def summarize_windows(windows):
+    """
+    Collapse detection windows (see WINDOW_SCHEMA) into one row per detector, source and target:
+    first and last window start, number of windows and peak value (see DETECTION_SCHEMA).
+    """
+    peak = pl.col("peak")
+    labels = [
+        pl.when(pl.col("detector") == detector).then(label(pl.col("target"), peak))
+        for detector, label in TARGET_LABELS.items()
+    ]
+    return (
+        windows.lazy()
+        .group_by("detector", "source", "target")
+        .agg(
+            pl.col("window_start").min().alias("first_window"),
+            pl.col("window_start").max().alias("last_window"),
+            pl.len().cast(pl.UInt32).alias("windows"),
+            pl.col("value").max().alias("peak"),
+        )
+        .select(
+            "detector",
+            "source",
+            pl.coalesce(labels).alias("target"),
+            "first_window",
+            "last_window",
+            "windows",
+            "peak",
+        )
+        .sort(
+            ["peak", "first_window", "detector", "source"],
+            descending=[True, False, False, False],
+        )
+    )
+
+
+def port_scan_windows(
+    df,
+    time_col="timestamp",
+    window=SCAN_WINDOW,
+    step=SCAN_STEP,
+    min_ports=MIN_SCANNED_PORTS,
+    min_hosts=MIN_SCANNED_HOSTS,
+    since=None,
+):
+    """
+    Find the sliding windows of port scans in firewall logs (ipsrc, ipdst, portdst):
+    vertical scans (one source probing at least min_ports distinct ports of one host) and
+    horizontal scans (one source probing one port on at least min_hosts distinct hosts).
+    Events are first deduplicated per step, which keeps distinct counts exact while shrinking
+    the data the windows run over.
+    Return a LazyFrame with one row per window flagged (see WINDOW_SCHEMA).
+    """
+    events = (
+        df.lazy()
+        .filter(pl.col(time_col).is_not_null())
+        .select(
+            pl.col(time_col).dt.truncate(step),
+            # Categorical codes make the grouping keys integers instead of strings
+            pl.col("ipsrc").cast(pl.Utf8).cast(pl.Categorical),
+            pl.col("ipdst").cast(pl.Utf8).cast(pl.Categorical),
+            pl.col("portdst").cast(pl.Utf8).cast(pl.Categorical),
+        )
+        .unique()
+        # Materialized once: both scan detectors and their candidate filters read it
+        .collect()
+        .lazy()
+    )
+    vertical = _sliding_windows(
+        events,
+        time_col,
+        ["ipsrc", "ipdst"],
+        pl.col("portdst").n_unique(),
+        pl.len(),
+        window,
+        step,
+        min_ports,
+        since,
+    )
+    horizontal = _sliding_windows(
+        events,
+        time_col,
+        ["ipsrc", "portdst"],
+        pl.col("ipdst").n_unique(),
+        pl.len(),
+        window,
+        step,
+        min_hosts,
+        since,
+    )
+    return pl.concat(
+        [
+            _detection_windows(
+                vertical, time_col, "Vertical port scan", "ipsrc", pl.col("ipdst")
+            ),
+            _detection_windows(
+                horizontal, time_col, "Horizontal port scan", "ipsrc", pl.col("portdst")
+            ),
+        ],
+        how="vertical",
+    )
+
+
+def port_scans(df, time_col="timestamp", **options):
+    """Detect port scans (see port_scan_windows); return a LazyFrame in DETECTION_SCHEMA."""
+    return summarize_windows(port_scan_windows(df, time_col, **options))
+
+
+def brute_force_windows(
+    df,
+    time_col,
+    text_col,
+    window=BRUTE_FORCE_WINDOW,
+    step=BRUTE_FORCE_STEP,
+    min_failures=MIN_FAILURES,
+    failure_pattern=FAILURE_PATTERN,
+    source_pattern=SOURCE_IP_PATTERN,
+    since=None,
+):
+    """
+    Find the sliding windows of SSH brute force in auth/ssh logs: authentication failures whose
+    message names a source IP, counted per source; windows with at least min_failures failures
+    are flagged. Failures are pre-counted per step before windowing.
+    Return a LazyFrame with one row per window flagged (see WINDOW_SCHEMA).
+    """
+    failures = (
+        df.lazy()
+        .filter(
+            pl.col(time_col).is_not_null()
+            & pl.col(text_col).cast(pl.Utf8).str.contains(failure_pattern)
+        )
+        .select(
+            pl.col(time_col).dt.truncate(step),
+            pl.col(text_col).cast(pl.Utf8).str.extract(source_pattern, 1).alias("ip"),
+        )
+        .drop_nulls("ip")
+        .group_by(time_col, "ip")
+        .agg(pl.len().alias("failures"))
+        .collect()
+        .lazy()
+    )
+    windows = _sliding_windows(
+        failures,
+        time_col,
+        ["ip"],
+        pl.col("failures").sum(),
+        pl.col("failures").sum(),
+        window,
+        step,
+        min_failures,
+        since,
+    )
+    return _detection_windows(windows, time_col, "SSH brute force", "ip", pl.lit("ssh"))
+
+
+def brute_force(df, time_col, text_col, **options):
+    """Detect SSH brute force (see brute_force_windows); return a LazyFrame in DETECTION_SCHEMA."""
+    return summarize_windows(brute_force_windows(df, time_col, text_col, **options))
+
+
+def detection_windows(df, time_col, text_col=None, since=None):
+    """
+    Run the detectors that apply to the columns of df and return their flagged windows in one
+    table (see WINDOW_SCHEMA): port scans when the firewall columns exist, brute force when a
+    message column is given. With `since`, only the windows starting from it are computed, so
+    the windows of rows appended later can be computed from the rows after since alone.
+    """
+    queries = []
+    if {"ipsrc", "ipdst", "portdst"} <= set(df.columns):
+        queries.append(port_scan_windows(df, time_col, since=since))
+    if text_col is not None:
+        queries.append(brute_force_windows(df, time_col, text_col, since=since))
+    if not queries:
+        return pl.DataFrame(schema=WINDOW_SCHEMA)
+    return pl.concat(queries, how="vertical").collect()
+
+
+def run_detectors(df, time_col, text_col=None):
+    """Run the detectors that apply to df and return their alerts, one row per source and target."""
+    return summarize_windows(detection_windows(df, time_col, text_col)).collect()
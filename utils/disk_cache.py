@@ -0,0 +1,98 @@
+import hashlib
+import os
+import shutil
+import threading
+
+import joblib
+
+# Fitted models and detector states survive restarts here (override with SHADOWLOG_CACHE_DIR)
+CACHE_DIR = os.environ.get("SHADOWLOG_CACHE_DIR", os.path.join(".cache", "shadowlog"))
+# Size of the cache (SHADOWLOG_CACHE_MAX_MB, in MB) above which the least recently used entries are removed
+CACHE_MAX_BYTES = int(float(os.environ.get("SHADOWLOG_CACHE_MAX_MB", 1024)) * 2**20)
+
+_evict_lock = threading.Lock()
+
+
+def cache_key(*parts):
+    """Return a short stable hash of the given parts (fingerprints, hyperparameters...)."""
+    return hashlib.blake2b(repr(parts).encode(), digest_size=16).hexdigest()
+
+
+def cache_path(namespace, key):
+    return os.path.join(CACHE_DIR, namespace, f"{key}.joblib")
+
+
+def load(namespace, key):
+    """Return the object saved under namespace/key, or None if it is missing or unreadable."""
+    path = cache_path(namespace, key)
+    if not os.path.exists(path):
+        return None
+    try:
+        value = joblib.load(path)
+        # The modification time records the last use, for the LRU eviction
+        os.utime(path)
+        return value
+    except Exception:
+        # A corrupted or outdated entry is treated as a cache miss
+        return None
+
+
+def save(namespace, key, value):
+    """Save value under namespace/key; the file is written aside and renamed, so readers never see half of it."""
+    path = cache_path(namespace, key)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    joblib.dump(value, tmp_path)
+    os.replace(tmp_path, path)
+    evict(keep=path)
+
+
+def delete(namespace, key):
+    """Remove the entry saved under namespace/key, if any."""
+    path = cache_path(namespace, key)
+    if os.path.exists(path):
+        os.remove(path)
+
+
+def _entries():
+    """Return (last use, size, path) of every entry of the cache."""
+    entries = []
+    for root, _, files in os.walk(CACHE_DIR):
+        for name in files:
+            if not name.endswith(".joblib"):
+                continue
+            path = os.path.join(root, name)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                # Removed meanwhile by another process
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+    return entries
+
+
+def evict(max_bytes=None, keep=None):
+    """
+    Remove the least recently used entries until the cache holds at most max_bytes
+    (CACHE_MAX_BYTES by default). The entry at path `keep` (the one just saved) is never removed.
+    """
+    max_bytes = CACHE_MAX_BYTES if max_bytes is None else max_bytes
+    with _evict_lock:
+        entries = _entries()
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= max_bytes:
+                break
+            if path == keep:
+                continue
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total -= size
+
+
+def clear(namespace=None):
+    """Remove every entry of a namespace, or the whole cache when namespace is None."""
+    path = CACHE_DIR if namespace is None else os.path.join(CACHE_DIR, namespace)
+    shutil.rmtree(path, ignore_errors=True)
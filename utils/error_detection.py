@@ -0,0 +1,174 @@
+import re
+
+import polars as pl
+
+ERROR_PATTERNS = [
+    "error",
+    "critical",
+    "fatal",
+    "fail",
+    "exception",
+    "crash",
+    "timeout",
+]
+# Keywords whose surrounding text names the kind of error
+ERROR_TYPE_PATTERNS = ["error", "exception", "fail"]
+CONTEXT_LENGTH = 50
+# Level values that make an entry part of an error sequence
+ERROR_LEVELS = ["ERROR", "CRITICAL", "FATAL"]
+MIN_RUN_LENGTH = 3
+# Columns added by match_keywords
+MATCH_COLUMNS = [
+    "is_error",
+    "error_column",
+    "error_pattern",
+    "error_offset",
+    "error_context",
+]
+
+
+def keyword_regex(patterns):
+    """Compile the keywords into a single case-insensitive alternation, capturing the matched one."""
+    return "(?i)(" + "|".join(re.escape(pattern) for pattern in patterns) + ")"
+
+
+def text_columns(df):
+    """Return the columns of df holding text (strings or categoricals)."""
+    return [
+        col
+        for col, dtype in df.collect_schema().items()
+        if dtype in (pl.Utf8, pl.Categorical) or isinstance(dtype, pl.Enum)
+    ]
+
+
+def match_keywords(df, columns, patterns=ERROR_PATTERNS, context_length=CONTEXT_LENGTH):
+    """
+    Scan the given columns for all keywords at once (one compiled regex per column) and add:
+    is_error (any match), error_column (first column with a match), error_pattern (keyword found,
+    lower case), error_offset (character offset of the match) and error_context (the text that
+    follows it). Non-text columns are cast to text first.
+    """
+    regex = keyword_regex(patterns)
+    available = df.collect_schema().names()
+    columns = [col for col in columns if col in available]
+    if not columns:
+        return df.with_columns(
+            pl.lit(False).alias("is_error"),
+            pl.lit(None, dtype=pl.Utf8).alias("error_column"),
+            pl.lit(None, dtype=pl.Utf8).alias("error_pattern"),
+            pl.lit(None, dtype=pl.UInt32).alias("error_offset"),
+            pl.lit(None, dtype=pl.Utf8).alias("error_context"),
+        )
+
+    texts = {col: pl.col(col).cast(pl.Utf8) for col in columns}
+    offsets = {col: text.str.find(regex) for col, text in texts.items()}
+    # The first column with a match provides the pattern, offset and context
+    first = pl.coalesce(
+        pl.when(offsets[col].is_not_null()).then(pl.lit(col)) for col in columns
+    )
+
+    def pick(exprs):
+        return pl.coalesce(
+            pl.when(offsets[col].is_not_null()).then(exprs[col]) for col in columns
+        )
+
+    return df.with_columns(
+        first.alias("error_column"),
+        pick({col: text.str.extract(regex, 1) for col, text in texts.items()})
+        .str.to_lowercase()
+        .alias("error_pattern"),
+        pick(offsets).alias("error_offset"),
+        pick(
+            {
+                col: text.str.slice(offsets[col], context_length).str.strip_chars()
+                for col, text in texts.items()
+            }
+        ).alias("error_context"),
+    ).with_columns(pl.col("error_column").is_not_null().alias("is_error"))
+
+
+def error_types(error_df, columns=None, patterns=ERROR_TYPE_PATTERNS, limit=10):
+    """
+    Count the error types found in the text columns of error_df: the text that follows the first
+    type keyword of each column. Every (row, column) match counts once; the `limit` most frequent
+    types are returned as a LazyFrame ("Error type", "Occurrences").
+    """
+    if columns is None:
+        columns = [col for col in text_columns(error_df) if col not in MATCH_COLUMNS]
+    if not columns:
+        return pl.LazyFrame(schema={"Error type": pl.Utf8, "Occurrences": pl.UInt32})
+    regex = keyword_regex(patterns)
+    contexts = [
+        pl.col(col)
+        .cast(pl.Utf8)
+        .str.slice(pl.col(col).cast(pl.Utf8).str.find(regex), CONTEXT_LENGTH)
+        .str.strip_chars()
+        .alias(col)
+        for col in columns
+    ]
+    return (
+        error_df.lazy()
+        .select(contexts)
+        .unpivot(on=columns, value_name="Error type")
+        .drop_nulls("Error type")
+        .group_by("Error type")
+        .agg(pl.len().alias("Occurrences"))
+        .sort(["Occurrences", "Error type"], descending=[True, False])
+        .head(limit)
+    )
+
+
+def label_error_runs(
+    df, level_cols, time_col=None, group_cols=(), max_gap=None, levels=ERROR_LEVELS
+):
+    """
+    Find the runs of consecutive error entries without a Python loop.
+    A row is an error when one of level_cols equals one of `levels` (case-insensitive).
+    Rows are ordered by group_cols then time_col; a run starts at an error row that follows a
+    non-error row, starts a new group, or comes more than max_gap (a timedelta) after the
+    previous row. Run ids are the cumulative count of run starts.
+    Return a LazyFrame of the error rows: row (position in df), run_id, time_col and group_cols.
+    """
+    group_cols = list(group_cols)
+    keys = group_cols + ([time_col] if time_col else [])
+    is_error = pl.any_horizontal(
+        pl.col(col).cast(pl.Utf8).str.to_uppercase().is_in(levels).fill_null(False)
+        for col in level_cols
+    )
+    query = df.lazy().with_row_index("row").select("row", *keys, is_error.alias("flag"))
+    if keys:
+        query = query.sort(keys, maintain_order=True)
+
+    starts = pl.col("flag") & ~pl.col("flag").shift(1).fill_null(False)
+    for col in group_cols:
+        starts = starts | pl.col("flag") & pl.col(col).ne_missing(pl.col(col).shift(1))
+    if time_col and max_gap is not None:
+        starts = starts | pl.col("flag") & (
+            (pl.col(time_col) - pl.col(time_col).shift(1)) > max_gap
+        ).fill_null(False)
+
+    return (
+        query.with_columns(starts.cum_sum().alias("run_id")).filter("flag").drop("flag")
+    )
+
+
+def summarize_runs(runs, time_col=None, group_cols=(), min_length=MIN_RUN_LENGTH):
+    """
+    Aggregate labeled error rows (see label_error_runs) into one row per run of at least
+    min_length entries: run_id, group_cols, length, and first/last time when time_col is given.
+    """
+    aggregations = [pl.col(col).first() for col in group_cols] + [
+        pl.len().alias("length")
+    ]
+    if time_col:
+        aggregations += [
+            pl.col(time_col).min().alias("start"),
+            pl.col(time_col).max().alias("end"),
+        ]
+    return (
+        runs.lazy()
+        .group_by("run_id")
+        .agg(aggregations)
+        .filter(pl.col("length") >= min_length)
+        .sort("run_id")
+    )
@@ -0,0 +1,67 @@
+import math
+
+import polars as pl
+import streamlit as st
+
+PAGE_SIZE = 500
+
+
+def paginated_dataframe(df, key, page_size=PAGE_SIZE):
+    """
+    Display a polars DataFrame one page at a time.
+    Sorting and text filtering are evaluated server-side with polars, and only the rows of the
+    visible page are serialized to the browser.
+    """
+    col_sort, col_order, col_search, col_page = st.columns([3, 2, 4, 2])
+
+    with col_sort:
+        sort_column = st.selectbox(
+            "Sort by", ["(none)"] + df.columns, key=f"{key}_sort_column"
+        )
+    with col_order:
+        descending = st.radio(
+            "Order",
+            ["Ascending", "Descending"],
+            horizontal=True,
+            key=f"{key}_sort_order",
+        )
+    with col_search:
+        search = st.text_input("Rows containing", key=f"{key}_search")
+
+    query = df.lazy()
+    text_columns = [
+        name for name, dtype in df.schema.items() if dtype in (pl.Utf8, pl.Categorical)
+    ]
+    if search and text_columns:
+        query = query.filter(
+            pl.any_horizontal(
+                pl.col(name).cast(pl.Utf8).str.contains(search, literal=True)
+                for name in text_columns
+            )
+        )
+        total = query.select(pl.len()).collect().item()
+    else:
+        total = df.height
+
+    page_count = max(math.ceil(total / page_size), 1)
+    page_key = f"{key}_page"
+    # Keep the current page valid when the filter shrinks the result
+    if st.session_state.get(page_key, 1) > page_count:
+        st.session_state[page_key] = page_count
+
+    with col_page:
+        page = st.number_input("Page", 1, page_count, step=1, key=page_key)
+
+    if sort_column != "(none)":
+        query = query.sort(
+            sort_column, descending=descending == "Descending", nulls_last=True
+        )
+
+    offset = (page - 1) * page_size
+    page_df = query.slice(offset, page_size).collect()
+
+    st.caption(
+        f"Rows {offset + 1 if total else 0:,}–{offset + page_df.height:,} "
+        f"of {total:,} (page {page} / {page_count})"
+    )
+    st.dataframe(page_df, use_container_width=True)
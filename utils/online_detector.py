@@ -0,0 +1,165 @@
+import math
+
+import polars as pl
+
+from utils import disk_cache
+from utils.time_index import time_slice
+
+DETECTOR_EVERY = "5m"
+EWMA_ALPHA = 0.1
+EWMA_SIGMAS = 3
+# Buckets seen before anomalies are reported (the baseline needs a few points to settle)
+EWMA_WARMUP = 12
+# Anomalies kept in the saved state (the most recent ones), so it stays small on long streams
+MAX_ANOMALIES = 1_000
+ANOMALY_SCHEMA = {
+    "bucket": pl.Datetime("us"),
+    "count": pl.Int64,
+    "expected": pl.Float64,
+    "lower_bound": pl.Float64,
+    "upper_bound": pl.Float64,
+}
+
+
+class EwmaDetector:
+    """
+    A class that scores event counts per time bucket against an exponentially weighted moving
+    mean and variance, updated online. The state is a handful of numbers plus the last
+    MAX_ANOMALIES anomalies found, so it can be saved after each batch and resumed later:
+    update() only counts and scores the buckets after the last scored one, which makes detection
+    O(new data) on appended datasets.
+    """
+
+    def __init__(
+        self,
+        every=DETECTOR_EVERY,
+        alpha=EWMA_ALPHA,
+        sigmas=EWMA_SIGMAS,
+        warmup=EWMA_WARMUP,
+    ):
+        self.every = every
+        self.alpha = alpha
+        self.sigmas = sigmas
+        self.warmup = warmup
+        self.mean = None
+        self.var = 0.0
+        self.n_buckets = 0
+        # Start of the first bucket not scored yet (the last bucket of a batch may be incomplete)
+        self.scored_until = None
+        self.anomalies = pl.DataFrame(schema=ANOMALY_SCHEMA)
+
+    def state(self):
+        """Return the detector state as a plain dict, for display."""
+        return {
+            "every": self.every,
+            "alpha": self.alpha,
+            "sigmas": self.sigmas,
+            "buckets_scored": self.n_buckets,
+            "scored_until": (
+                str(self.scored_until) if self.scored_until is not None else None
+            ),
+            "mean": self.mean,
+            "std": math.sqrt(self.var),
+            "anomalies": self.anomalies.height,
+        }
+
+    def _new_counts(self, df, time_col):
+        """Count the events of the complete buckets after scored_until, zero-filling empty ones."""
+        last = df[time_col].max()
+        if last is None:
+            return pl.DataFrame(schema={"bucket": pl.Datetime("us"), "count": pl.Int64})
+        if self.scored_until is not None:
+            # The dataset is sorted by time: the new rows are found by binary search
+            df = time_slice(df, self.scored_until, last, column=time_col)
+        first = (
+            self.scored_until if self.scored_until is not None else df[time_col].min()
+        )
+        first, last = pl.select(
+            pl.lit(first).dt.truncate(self.every).alias("first"),
+            pl.lit(last).dt.truncate(self.every).alias("last"),
+        ).row(0)
+
+        counts = (
+            df.lazy()
+            .filter(pl.col(time_col).is_not_null())
+            .group_by(pl.col(time_col).dt.truncate(self.every).alias("bucket"))
+            .agg(pl.len().cast(pl.Int64).alias("count"))
+            .with_columns(pl.col("bucket").cast(pl.Datetime("us")))
+        )
+        # The bucket holding the last event may still receive events: it is left for the next batch
+        buckets = pl.LazyFrame(
+            {
+                "bucket": pl.datetime_range(
+                    first, last, self.every, closed="left", time_unit="us", eager=True
+                )
+            }
+        )
+        return (
+            buckets.join(counts, on="bucket", how="left")
+            .with_columns(pl.col("count").fill_null(0))
+            .sort("bucket")
+            .collect()
+        )
+
+    def update(self, df, time_col):
+        """
+        Count and score the buckets of df not scored yet, update the state with them and return
+        them with their expected value, bounds and anomaly flag.
+        """
+        counts = self._new_counts(df, time_col)
+        expected, lower, upper, flags = [], [], [], []
+        for count in counts["count"]:
+            if self.mean is None:
+                self.mean = float(count)
+            std = math.sqrt(self.var)
+            low = max(self.mean - self.sigmas * std, 0.0)
+            high = self.mean + self.sigmas * std
+            expected.append(self.mean)
+            lower.append(low)
+            upper.append(high)
+            flags.append(self.n_buckets >= self.warmup and not low <= count <= high)
+
+            # Online EWMA update of the mean and variance
+            diff = count - self.mean
+            increment = self.alpha * diff
+            self.mean += increment
+            self.var = (1 - self.alpha) * (self.var + diff * increment)
+            self.n_buckets += 1
+
+        scored = counts.with_columns(
+            pl.Series("expected", expected, dtype=pl.Float64),
+            pl.Series("lower_bound", lower, dtype=pl.Float64),
+            pl.Series("upper_bound", upper, dtype=pl.Float64),
+            pl.Series("is_anomaly", flags, dtype=pl.Boolean),
+        )
+        if not scored.is_empty():
+            self.scored_until = scored["bucket"].dt.offset_by(self.every).max()
+            self.anomalies = pl.concat(
+                [self.anomalies, scored.filter("is_anomaly").select(ANOMALY_SCHEMA)]
+            ).tail(MAX_ANOMALIES)
+        return scored
+
+
+def stream_key(handle, time_col):
+    """
+    Identify the event stream of a dataset: datasets built by appending to another one share
+    the detector of the first dataset of their lineage.
+    """
+    ancestors = handle.ancestors()
+    root = ancestors[-1][0] if ancestors else handle.key
+    return disk_cache.cache_key(root, time_col, DETECTOR_EVERY)
+
+
+def load_detector(key):
+    """Return the saved detector of a stream, or a fresh one."""
+    detector = disk_cache.load("online_detector", key)
+    return detector if detector is not None else EwmaDetector()
+
+
+def save_detector(key, detector):
+    disk_cache.save("online_detector", key, detector)
+
+
+def reset_detector(key):
+    """Forget the state of a stream: the next update scores its whole history again."""
+    disk_cache.delete("online_detector", key)
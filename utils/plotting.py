@@ -0,0 +1,99 @@
+import numpy as np
+import polars as pl
+
+# Maximum number of points sent to the browser for a single chart
+LINE_POINT_BUDGET = 2000
+SCATTER_POINT_BUDGET = 20000
+DENSITY_BINS = 120
+
+
+def lttb(x, y, n_out=LINE_POINT_BUDGET):
+    """
+    Largest-Triangle-Three-Buckets downsampling of a series sorted by x.
+    Return the indices of the points to keep (the first and last points are always kept).
+    """
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    n = len(x)
+    if n_out >= n or n_out < 3:
+        return np.arange(n)
+
+    # n_out - 2 buckets between the first and the last point
+    edges = np.linspace(1, n - 1, n_out - 1).astype(np.int64)
+    selected = np.empty(n_out, dtype=np.int64)
+    selected[0], selected[-1] = 0, n - 1
+
+    previous = 0
+    for i in range(n_out - 2):
+        start, end = edges[i], edges[i + 1]
+        # Average of the next bucket (or the last point for the last bucket)
+        next_start, next_end = end, edges[i + 2] if i + 2 < len(edges) else n
+        avg_x = x[next_start:next_end].mean()
+        avg_y = y[next_start:next_end].mean()
+
+        area = np.abs(
+            (x[previous] - avg_x) * (y[start:end] - y[previous])
+            - (x[previous] - x[start:end]) * (avg_y - y[previous])
+        )
+        previous = start + int(np.argmax(area))
+        selected[i + 1] = previous
+
+    return selected
+
+
+def downsample_line(df, x_col, y_col, n_out=LINE_POINT_BUDGET):
+    """Return the rows of a time series (polars) that LTTB keeps for a budget of n_out points."""
+    if df.height <= n_out:
+        return df
+    x = df[x_col]
+    if x.dtype.is_temporal():
+        x = x.to_physical()
+    return df[lttb(x.to_numpy(), df[y_col].to_numpy(), n_out)]
+
+
+def density_tiles(x, y, groups=None, bins=DENSITY_BINS):
+    """
+    Bin a dense scatter into a bins x bins grid of tiles, separately for each group.
+    Return a polars DataFrame with the tile centers, the number of points per tile and the group,
+    keeping non-empty tiles only.
+    """
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    groups = np.zeros(len(x), dtype=np.int64) if groups is None else np.asarray(groups)
+    x_edges = np.linspace(x.min(), x.max(), bins + 1)
+    y_edges = np.linspace(y.min(), y.max(), bins + 1)
+    x_centers = (x_edges[:-1] + x_edges[1:]) / 2
+    y_centers = (y_edges[:-1] + y_edges[1:]) / 2
+
+    tiles = []
+    for group in np.unique(groups):
+        mask = groups == group
+        counts, _, _ = np.histogram2d(x[mask], y[mask], bins=[x_edges, y_edges])
+        ix, iy = np.nonzero(counts)
+        tiles.append(
+            pl.DataFrame(
+                {
+                    "x": x_centers[ix],
+                    "y": y_centers[iy],
+                    "count": counts[ix, iy].astype(np.int64),
+                    "group": np.full(len(ix), group),
+                }
+            )
+        )
+    return pl.concat(tiles)
+
+
+def top_categories(df, category_col, weight_col, max_points=SCATTER_POINT_BUDGET):
+    """
+    Keep the rows of the heaviest categories (by summed weight) so that at most max_points rows remain.
+    Used for scatters on a categorical axis, where no spatial decimation applies.
+    """
+    if df.height <= max_points:
+        return df
+    rows_per_category = df.height / df[category_col].n_unique()
+    kept = (
+        df.group_by(category_col)
+        .agg(pl.col(weight_col).sum())
+        .top_k(max(int(max_points / rows_per_category), 1), by=weight_col)
+    )
+    return df.filter(pl.col(category_col).is_in(kept[category_col].to_list()))
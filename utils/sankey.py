@@ -0,0 +1,52 @@
+import polars as pl
+
+SANKEY_TOP_K = 25
+SANKEY_MAX_LINKS = 300
+
+
+def prune_flows(
+    flows, source_col, target_col, k=SANKEY_TOP_K, max_links=SANKEY_MAX_LINKS
+):
+    """
+    Keep the endpoints of the k heaviest (source, target) flows and collapse every other source
+    and target into an "Other <column>" node, then cap the number of links to max_links.
+    `flows` holds one row per pair with its "count", so the selection is a single top-k pass.
+    """
+    heavy = flows.top_k(k, by="count")
+    other_sources = f"Other {source_col}"
+    other_targets = f"Other {target_col}"
+
+    return (
+        flows.lazy()
+        .with_columns(
+            pl.when(pl.col(source_col).is_in(heavy[source_col].to_list()))
+            .then(pl.col(source_col))
+            .otherwise(pl.lit(other_sources))
+            .alias(source_col),
+            pl.when(pl.col(target_col).is_in(heavy[target_col].to_list()))
+            .then(pl.col(target_col))
+            .otherwise(pl.lit(other_targets))
+            .alias(target_col),
+        )
+        .group_by([source_col, target_col])
+        .agg(pl.col("count").sum())
+        .sort("count", descending=True)
+        .head(max_links)
+        .collect()
+    )
+
+
+def sankey_links(links, source_col, target_col):
+    """
+    Return (labels, sources, targets, values) for a plotly Sankey.
+    Labels are indexed with an Enum cast instead of a per-row Python mapping.
+    """
+    labels = (
+        pl.concat([links[source_col], links[target_col]])
+        .unique(maintain_order=True)
+        .to_list()
+    )
+    node_index = pl.Enum(labels)
+    sources = links[source_col].cast(node_index).to_physical()
+    targets = links[target_col].cast(node_index).to_physical()
+    return labels, sources.to_list(), targets.to_list(), links["count"].to_list()
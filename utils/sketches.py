@@ -0,0 +1,188 @@
+import numpy as np
+import polars as pl
+
+# Above this many rows, distinct counts and top values are estimated with the sketches below
+APPROX_ROW_THRESHOLD = 5_000_000
+# 2**14 registers: relative standard error of the distinct count 1.04 / sqrt(2**14) ~ 0.8%
+HLL_PRECISION = 14
+# Counters kept by a heavy-hitters summary; the count error is at most rows / (capacity + 1)
+HEAVY_HITTERS_CAPACITY = 1_000
+# Rows counted exactly at a time by a heavy-hitters summary (bounds its hash table)
+SKETCH_CHUNK_ROWS = 1_000_000
+# Sketches built with the same seed can be merged (within one polars version)
+HASH_SEED = 0x5EED
+
+
+def _hashable(col, dtype):
+    """Return col with categorical-like dtypes decoded, so equal values hash equally across frames."""
+    if dtype in (pl.Categorical, pl.Enum):
+        return col.cast(pl.Utf8)
+    return col
+
+
+class HyperLogLog:
+    """
+    A class that estimates the number of distinct values of a column with a HyperLogLog sketch:
+    2**precision one-byte registers, whatever the number of rows or distinct values.
+    Sketches of the same precision merge by taking the register-wise maximum, so a sketch of
+    several files or batches is the merge of their sketches.
+    """
+
+    def __init__(self, precision=HLL_PRECISION):
+        self.precision = precision
+        self.registers = np.zeros(1 << precision, dtype=np.uint8)
+
+    @staticmethod
+    def registers_query(lazy, column, dtype, precision=HLL_PRECISION):
+        """
+        Return a LazyFrame (register, rank) computing the registers of a column of lazy:
+        the top `precision` bits of the hash of each value pick a register and the number of
+        trailing zero bits of the others (+1) is its rank; each register keeps its maximum rank.
+        """
+        low_bits = 64 - precision
+        hashed = _hashable(pl.col(column), dtype).hash(HASH_SEED)
+        return (
+            lazy.select(
+                (hashed // (1 << low_bits)).cast(pl.UInt32).alias("register"),
+                # The bit above the low ones caps the rank when they are all zeros
+                ((hashed % (1 << low_bits)) | (1 << low_bits))
+                .bitwise_trailing_zeros()
+                .cast(pl.UInt8)
+                .add(1)
+                .alias("rank"),
+            )
+            .group_by("register")
+            .agg(pl.col("rank").max())
+        )
+
+    @classmethod
+    def from_registers(cls, registers, precision=HLL_PRECISION):
+        """Build a sketch from the (register, rank) frame computed by registers_query."""
+        sketch = cls(precision)
+        sketch.registers[registers["register"].to_numpy()] = registers[
+            "rank"
+        ].to_numpy()
+        return sketch
+
+    @classmethod
+    def from_series(cls, series, precision=HLL_PRECISION):
+        frame = series.to_frame("value")
+        return cls.from_registers(
+            cls.registers_query(
+                frame.lazy(), "value", series.dtype, precision
+            ).collect(),
+            precision,
+        )
+
+    def merge(self, other):
+        """Fold another sketch of the same precision into this one and return it."""
+        if other.precision != self.precision:
+            raise ValueError(
+                "HyperLogLog sketches of different precisions cannot be merged"
+            )
+        np.maximum(self.registers, other.registers, out=self.registers)
+        return self
+
+    @property
+    def relative_error(self):
+        """Relative standard error of the estimate."""
+        return 1.04 / np.sqrt(len(self.registers))
+
+    def estimate(self):
+        """Return the estimated number of distinct values."""
+        m = len(self.registers)
+        alpha = 0.7213 / (1 + 1.079 / m)
+        estimate = alpha * m * m / np.sum(np.exp2(-self.registers.astype(np.float64)))
+        empty = np.count_nonzero(self.registers == 0)
+        if estimate <= 2.5 * m and empty:
+            # Small cardinalities: linear counting on the empty registers is more accurate
+            estimate = m * np.log(m / empty)
+        return int(round(estimate))
+
+
+class HeavyHitters:
+    """
+    A class that keeps the most frequent values of a column in a bounded summary
+    (Misra-Gries, the mergeable form of Space-Saving): at most `capacity` counters, each a lower
+    bound of the true count of its value; the true count is at most the counter plus `error`,
+    and any value left out of the summary occurs at most `error` times. The error grows with
+    rows / (capacity + 1) at most.
+    Values are counted exactly by chunks of SKETCH_CHUNK_ROWS rows, so memory is bounded by the
+    chunk size instead of the number of distinct values, and summaries of several files or
+    batches merge into the summary of their union.
+    """
+
+    def __init__(self, capacity=HEAVY_HITTERS_CAPACITY):
+        self.capacity = capacity
+        self.counts = None
+        self.error = 0
+        self.total = 0
+
+    @classmethod
+    def from_series(cls, series, weights=None, capacity=HEAVY_HITTERS_CAPACITY):
+        """Summarize a series; `weights` (same length) counts each row that many times."""
+        sketch = cls(capacity)
+        sketch.add(series, weights)
+        return sketch
+
+    @classmethod
+    def from_counts(cls, counts, capacity=HEAVY_HITTERS_CAPACITY):
+        """Summarize exact counts already computed: a frame (value, count)."""
+        sketch = cls(capacity)
+        counts = counts.select("value", pl.col("count").cast(pl.UInt64))
+        if counts["value"].dtype in (pl.Categorical, pl.Enum):
+            counts = counts.with_columns(pl.col("value").cast(pl.Utf8))
+        sketch._fold(counts, 0, counts["count"].sum())
+        return sketch
+
+    def add(self, series, weights=None):
+        """Count the values of a series (optionally weighted) into the summary."""
+        values = series.rename("value")
+        if values.dtype in (pl.Categorical, pl.Enum):
+            values = values.cast(pl.Utf8)
+        frame = values.to_frame()
+        if weights is not None:
+            frame = frame.with_columns(weights.cast(pl.UInt64).alias("count"))
+        for chunk in frame.iter_slices(SKETCH_CHUNK_ROWS):
+            count = pl.col("count").sum() if weights is not None else pl.len()
+            counts = chunk.group_by("value").agg(count.cast(pl.UInt64).alias("count"))
+            self._fold(counts, 0, counts["count"].sum())
+        return self
+
+    def merge(self, other):
+        """Fold another summary into this one and return it."""
+        if other.counts is not None:
+            self._fold(other.counts, other.error, other.total)
+        return self
+
+    def _fold(self, counts, error, total):
+        if self.counts is not None:
+            counts = (
+                pl.concat([self.counts, counts], how="vertical_relaxed")
+                .group_by("value")
+                .agg(pl.col("count").sum())
+            )
+        self.error += error
+        self.total += total
+        if counts.height > self.capacity:
+            # Decrement every counter by the (capacity + 1)-th largest: at most capacity remain
+            threshold = counts["count"].sort(descending=True)[self.capacity]
+            counts = counts.filter(pl.col("count") > threshold).with_columns(
+                pl.col("count") - threshold
+            )
+            self.error += threshold
+        self.counts = counts
+
+    def top(self, k=None):
+        """
+        Return the k most frequent values (all counters when k is None) with their count
+        (a lower bound) and upper_bound, sorted by count.
+        """
+        if self.counts is None:
+            return pl.DataFrame(
+                schema={"value": pl.Null, "count": pl.UInt64, "upper_bound": pl.UInt64}
+            )
+        top = self.counts.sort(["count", "value"], descending=[True, False])
+        if k is not None:
+            top = top.head(k)
+        return top.with_columns((pl.col("count") + self.error).alias("upper_bound"))
@@ -0,0 +1,121 @@
+import re
+import threading
+import time
+
+import duckdb
+import polars as pl
+import pyarrow as pa
+import streamlit as st
+
+# Name under which the session dataset is visible to SQL queries
+SQL_TABLE = "logs"
+SQL_ROW_LIMIT = 10_000
+SQL_TIMEOUT = 30
+SQL_CACHE_ENTRIES = 32
+# Rows fetched at a time from DuckDB: the fetch stops as soon as the row limit is reached
+SQL_FETCH_ROWS = 2_048
+
+_TOKENS = re.compile(
+    r"(?P<comment>--[^\n]*|/\*.*?\*/)"
+    r"|(?P<quoted>'(?:[^']|'')*'|\"(?:[^\"]|\"\")*\")"
+    r"|(?P<space>\s+)"
+    r"|(?P<word>[^'\"\s-]+|-)",
+    re.DOTALL,
+)
+
+
+def normalize_query(sql):
+    """
+    Return a canonical form of a SQL query, used as its cache key: comments removed, whitespace
+    collapsed, a trailing semicolon dropped and everything outside quotes lowercased
+    (DuckDB keywords and unquoted identifiers are case-insensitive).
+    """
+    parts = []
+    for match in _TOKENS.finditer(sql):
+        if match.lastgroup in ("comment", "space"):
+            parts.append(" ")
+        elif match.lastgroup == "quoted":
+            parts.append(match.group())
+        else:
+            parts.append(match.group().lower())
+    return re.sub(r"\s+", " ", "".join(parts)).strip().rstrip(";").strip()
+
+
+def _connect(df, zero_copy=True):
+    """
+    Return an in-memory DuckDB connection where df is the view SQL_TABLE.
+    With zero_copy the Arrow buffers of df are shared as they are (strings as string views);
+    otherwise strings are copied to large strings, which every pyarrow kernel supports.
+    External access (files, extensions) is disabled: queries only see the dataset.
+    """
+    compat_level = pl.CompatLevel.newest() if zero_copy else pl.CompatLevel.oldest()
+    conn = duckdb.connect()
+    conn.register(SQL_TABLE, df.to_arrow(compat_level=compat_level))
+    conn.execute("SET enable_external_access = false")
+    conn.execute("SET lock_configuration = true")
+    return conn
+
+
+def _execute(df, action, timeout):
+    """
+    Run action(conn) on a connection over df, interrupted after timeout seconds.
+    When pyarrow cannot evaluate a filter pushed down on string views, it is retried on a copy
+    of the strings.
+    """
+    for zero_copy in (True, False):
+        conn = _connect(df, zero_copy)
+        timer = threading.Timer(timeout, conn.interrupt)
+        timer.start()
+        try:
+            return action(conn)
+        except duckdb.InterruptException:
+            raise TimeoutError(f"The query was interrupted after {timeout} s.")
+        except duckdb.InvalidInputException as e:
+            if not zero_copy or "arrow_scan" not in str(e):
+                raise
+        finally:
+            timer.cancel()
+            conn.close()
+
+
+def _fetch(conn, sql, limit):
+    started = time.perf_counter()
+    cursor = conn.execute(sql)
+    if cursor.description is None:
+        # Statements without a result (SET, CREATE...): nothing to show
+        return pl.DataFrame(), False, time.perf_counter() - started
+    reader = cursor.to_arrow_reader(SQL_FETCH_ROWS)
+    batches, rows = [], 0
+    for batch in reader:
+        batches.append(batch)
+        rows += batch.num_rows
+        if rows > limit:
+            break
+    result = pl.from_arrow(pa.Table.from_batches(batches, schema=reader.schema))
+    return result.head(limit), rows > limit, time.perf_counter() - started
+
+
+@st.cache_data(max_entries=SQL_CACHE_ENTRIES, show_spinner=False)
+def run_query(fingerprint, normalized_sql, limit, _df, _sql, timeout=SQL_TIMEOUT):
+    """
+    Run a SQL query on the dataset _df (table SQL_TABLE) and return a dict with the first `limit`
+    rows ("result", a polars DataFrame), whether more rows exist ("truncated") and the time
+    spent ("seconds"). Results are streamed, so only limit + one batch rows are fetched.
+    Cached on the dataset fingerprint and the normalized query: the raw text _sql is not hashed.
+    """
+    result, truncated, seconds = _execute(
+        _df, lambda conn: _fetch(conn, _sql, limit), timeout
+    )
+    return {"result": result, "truncated": truncated, "seconds": seconds}
+
+
+def explain_analyze(df, sql, timeout=SQL_TIMEOUT):
+    """Run the query with EXPLAIN ANALYZE and return the profiled plan (operators, rows, timings)."""
+    rows = _execute(
+        df,
+        lambda conn: conn.execute(
+            f"EXPLAIN ANALYZE {sql.strip().rstrip(';')}"
+        ).fetchall(),
+        timeout,
+    )
+    return "\n".join(row[-1] for row in rows)
@@ -0,0 +1,141 @@
+import csv
+import ipaddress
+
+import numpy as np
+import polars as pl
+
+from config.subnet_definitions import subnet_definitions
+
+
+class SubnetRegistry:
+    """
+    A class that takes labeled network prefixes and labels whole columns of IP addresses.
+    IPv4 prefixes are compiled into a sorted table of disjoint intervals (the most specific prefix wins),
+    so a column is labeled with one binary search per distinct address.
+    """
+
+    def __init__(self, entries):
+        self.entries = []
+        for entry in entries:
+            network = ipaddress.ip_network(entry["network"], strict=False)
+            self.entries.append(
+                {
+                    "network": network,
+                    "label": entry["label"],
+                    "internal": str(entry.get("internal", False)).lower()
+                    in ("true", "1", "yes"),
+                }
+            )
+        self.internal_labels = sorted(
+            {entry["label"] for entry in self.entries if entry["internal"]}
+        )
+        self._labels = [entry["label"] for entry in self.entries]
+        self._compile_ipv4()
+        # IPv6 addresses are rare in our logs: they are matched one by one and memoized
+        self._ipv6_networks = sorted(
+            (
+                (entry["network"], i)
+                for i, entry in enumerate(self.entries)
+                if entry["network"].version == 6
+            ),
+            key=lambda item: item[0].prefixlen,
+            reverse=True,
+        )
+        self._ipv6_memo = {}
+
+    @classmethod
+    def from_config(cls, definitions=subnet_definitions):
+        """Build the registry from the subnet definitions and the CSV files they reference."""
+        entries = list(definitions["subnets"])
+        for path in definitions.get("files", []):
+            with open(path, newline="") as f:
+                entries.extend(csv.DictReader(f))
+        return cls(entries)
+
+    def _compile_ipv4(self):
+        """Flatten the (possibly nested) IPv4 prefixes into disjoint intervals labeled by the most specific one."""
+        ipv4 = [
+            (int(entry["network"].network_address), entry["network"].num_addresses, i)
+            for i, entry in enumerate(self.entries)
+            if entry["network"].version == 4
+        ]
+        bounds = np.unique(
+            np.array(
+                [start for start, _, _ in ipv4]
+                + [start + size for start, size, _ in ipv4],
+                dtype=np.int64,
+            )
+        )
+        owners = np.full(len(bounds), -1, dtype=np.int64)
+        # Paint from the widest to the most specific prefix, so nested prefixes override their parents
+        for start, size, index in sorted(ipv4, key=lambda item: -item[1]):
+            lower, upper = np.searchsorted(bounds, [start, start + size])
+            owners[lower:upper] = index
+        self._ipv4_bounds = bounds
+        self._ipv4_owners = owners
+
+    def _label_ipv4(self, addresses):
+        """Return the entry index of each IPv4 address given as integers (-1 when no prefix matches)."""
+        if len(self._ipv4_bounds) == 0:
+            return np.full(len(addresses), -1, dtype=np.int64)
+        positions = np.searchsorted(self._ipv4_bounds, addresses, side="right") - 1
+        return np.where(positions >= 0, self._ipv4_owners[positions.clip(0)], -1)
+
+    def _label_ipv6(self, address):
+        """Return the entry index of the most specific IPv6 prefix containing address (-1 if none), memoized."""
+        if address not in self._ipv6_memo:
+            owner = -1
+            try:
+                ip = ipaddress.ip_address(address)
+                owner = next((i for net, i in self._ipv6_networks if ip in net), -1)
+            except ValueError:
+                pass
+            self._ipv6_memo[address] = owner
+        return self._ipv6_memo[address]
+
+    def label(self, ips):
+        """Return the label of the most specific prefix containing each IP of a polars Series (null if none)."""
+        # Each distinct address is classified once: the categorical codes map rows to distinct values
+        encoded = ips if ips.dtype == pl.Categorical else ips.cast(pl.Categorical)
+        distinct = encoded.cat.get_categories()
+
+        octets = distinct.str.split_exact(".", 3).struct.unnest()
+        octets = octets.select(pl.all().cast(pl.Int64, strict=False))
+        is_ipv4 = (
+            octets.select(
+                pl.all_horizontal(pl.all().is_between(0, 255)).fill_null(False)
+            )
+            .to_series()
+            .to_numpy()
+        )
+        as_int = octets.select(
+            pl.sum_horizontal(
+                pl.col(name).fill_null(0) * (1 << (8 * (3 - i)))
+                for i, name in enumerate(octets.columns)
+            )
+        ).to_series()
+
+        owners = np.where(is_ipv4, self._label_ipv4(as_int.to_numpy()), -1)
+        if self._ipv6_networks:
+            for i in np.flatnonzero(~is_ipv4):
+                owners[i] = self._label_ipv6(distinct[int(i)])
+
+        # Unmatched addresses point to the trailing null label
+        owners = np.where(owners >= 0, owners, len(self._labels))
+        labels = pl.Series(ips.name, self._labels + [None], dtype=pl.Utf8)
+        return labels.gather(pl.Series(owners).gather(encoded.to_physical()))
+
+    def is_internal(self, ips):
+        """Return a boolean Series telling whether each IP belongs to an internal prefix."""
+        return self.label(ips).is_in(self.internal_labels).fill_null(False)
+
+
+_registry = None
+
+
+def get_subnet_registry():
+    """Return the registry compiled from config/subnet_definitions.py (built once per process)."""
+    global _registry
+    if _registry is None:
+        _registry = SubnetRegistry.from_config()
+    return _registry
@@ -0,0 +1,23 @@
+import polars as pl
+
+
+def sort_by_time(df, column="timestamp"):
+    """Sort the dataset by its time column once; polars then flags the column as sorted."""
+    if column not in df.columns or df[column].flags["SORTED_ASC"]:
+        return df
+    return df.sort(column)
+
+
+def time_slice(df, start, end, column="timestamp"):
+    """
+    Return the rows whose time column lies between start and end (both included).
+    On a sorted column the bounds are found by binary search and the result is a zero-copy slice,
+    otherwise the column is scanned.
+    """
+    series = df[column]
+    if not series.flags["SORTED_ASC"]:
+        return df.filter(pl.col(column).is_between(start, end))
+
+    lower = series.search_sorted(start, side="left")
+    upper = series.search_sorted(end, side="right")
+    return df.slice(lower, max(upper - lower, 0))
@@ -0,0 +1,75 @@
+from datetime import timedelta
+
+import polars as pl
+
+# Width of each pyramid level, in seconds, from the finest to the coarsest
+PYRAMID_LEVELS = {"second": 1, "minute": 60, "hour": 3600, "day": 86400}
+POINT_BUDGET = 5000
+
+
+def build_time_pyramid(df, time_col="timestamp", split_col="action"):
+    """
+    Count events per second, minute, hour and day (split by split_col when the column exists).
+    Buckets are computed by integer division of the epoch, and each level is rolled up from the finer one,
+    so the raw rows are scanned only once.
+    """
+    keys = [split_col] if split_col in df.columns else []
+    finest = (
+        df.lazy()
+        .filter(pl.col(time_col).is_not_null())
+        .group_by([pl.col(time_col).dt.epoch("s").alias("bucket")] + keys)
+        .agg(pl.len().alias("count"))
+    )
+
+    levels = []
+    for width in PYRAMID_LEVELS.values():
+        level = finest
+        if width > 1:
+            level = finest.group_by([(pl.col("bucket") // width) * width] + keys).agg(
+                pl.col("count").sum()
+            )
+        levels.append(
+            level.with_columns(pl.from_epoch("bucket", time_unit="s")).sort("bucket")
+        )
+
+    return {
+        "split_col": keys[0] if keys else None,
+        "levels": dict(zip(PYRAMID_LEVELS, pl.collect_all(levels))),
+    }
+
+
+def time_extent(pyramid):
+    """Return the first and last second of the pyramid, or (None, None) when it is empty."""
+    seconds = pyramid["levels"]["second"]["bucket"]
+    return seconds.min(), seconds.max()
+
+
+def select_level(pyramid, start, end, budget=POINT_BUDGET, finest="second"):
+    """Return the finest level (not finer than `finest`) whose number of points over [start, end] fits the budget."""
+    names = list(PYRAMID_LEVELS)
+    span = (end - start).total_seconds() if start is not None else 0
+    for name in names[names.index(finest) :]:
+        if span / PYRAMID_LEVELS[name] <= budget:
+            return name
+    return names[-1]
+
+
+def level_series(pyramid, level, start=None, end=None, split_value=None, step=1):
+    """
+    Return (bucket, count) rows of a pyramid level, optionally restricted to the buckets
+    overlapping [start, end], to one value of the split column, and regrouped into buckets of
+    `step` level units.
+    """
+    query = pyramid["levels"][level].lazy()
+    if start is not None and end is not None:
+        width = timedelta(seconds=PYRAMID_LEVELS[level])
+        query = query.filter(
+            (pl.col("bucket") > start - width) & (pl.col("bucket") <= end)
+        )
+    if split_value is not None:
+        query = query.filter(pl.col(pyramid["split_col"]) == split_value)
+
+    bucket = pl.col("bucket")
+    if step > 1:
+        bucket = bucket.dt.truncate(f"{step * PYRAMID_LEVELS[level]}s")
+    return query.group_by(bucket).agg(pl.col("count").sum()).sort("bucket").collect()